@@ -4,19 +4,27 @@ import threading
 import os
 import re
 import hashlib
+import tempfile
+from array import array
+from bisect import bisect_left
 import xml.etree.ElementTree as ET
 from dataclasses import dataclass
 from datetime import datetime, timezone
 from email.utils import parsedate_to_datetime
 from urllib.parse import urlparse, urlunparse, parse_qsl, urlencode
 from concurrent.futures import ThreadPoolExecutor, as_completed, TimeoutError
-from typing import List, Dict, Optional, Tuple
+from typing import Callable, List, Dict, Optional, Sequence, Tuple
 import math
 
 import ccxt
+import numpy as np
 import pandas as pd
 import requests
+from requests.adapters import HTTPAdapter
 
+import indicator_kernels
+from indicator_stream import IndicatorStream
+from rolling_window import BarWindows
 from probability_engine import get_probability, make_key
 
 # ================== ТВОИ ДАННЫЕ ==================
@@ -67,6 +75,8 @@ COOLDOWN_MINUTES = 90
 MIN_CONFIDENCE = 62
 DEFAULT_LEVERAGE = 10
 DEFAULT_POSITION_USD = 25.0
+# leverage grid of the risk preview in /settings
+RISK_PREVIEW_LEVERAGES = (5, 10, 20, 25, 50, 75, 100)
 
 # News system config
 NEWS_ENABLED = True
@@ -100,6 +110,19 @@ RSS_FEEDS = [
 ]
 GDELT_DOC_ENDPOINT = "https://api.gdeltproject.org/api/v2/doc/doc"
 
+# Shared HTTP client (Telegram, news, translation): keep-alive pool per host
+HTTP_POOL_CONNECTIONS = 8
+HTTP_POOL_MAXSIZE = 8
+HTTP_DEFAULT_TIMEOUT = (3, 10)
+HTTP_HOST_TIMEOUTS = {
+    "api.telegram.org": (3, 15),
+    "api.mymemory.translated.net": NEWS_TRANSLATE_TIMEOUT,
+    "cryptopanic.com": NEWS_HTTP_TIMEOUT_API,
+    "api.gdeltproject.org": NEWS_HTTP_TIMEOUT_API,
+}
+# host -> base url, e.g. {"api.telegram.org": "http://127.0.0.1:8081"} for a local fake server
+HTTP_BASE_URL_OVERRIDES: Dict[str, str] = {}
+
 # Engine v2 config
 ENGINE_V2_ENABLED = True
 ENGINE_V2_USE_MTF = True
@@ -114,18 +137,83 @@ ENGINE_V3_ANOMALY_RANGE_MULT = 15
 ENGINE_V3_MAX_GAP_PCT = 0.2
 ENGINE_V3_MAX_SPREAD_PCT = 0.25
 ENGINE_V3_CORR_THRESHOLD = 0.9
+# returns over the last N closed bars, joined by timestamp; the matrix is rebuilt once per bar
+ENGINE_V3_CORR_RETURNS_WINDOW = 120
+# a pair is correlated over the returns both symbols have; fewer shared returns -> returns_missing
+ENGINE_V3_CORR_MIN_OVERLAP = 100
+# cheap O(window) check on raw columns (level distance, volume ratio) before the integrity
+# gate and indicators; symbols failing it could not produce a setup anyway
+ENGINE_V3_PREFILTER_ENABLED = True
 
 # Timeframes
 BASE_TIMEFRAME = TIMEFRAME
 HIGHER_TIMEFRAME = "1h"
 LOWER_TIMEFRAME = "5m"
 
+# Data layer
+# incremental refresh: fetch only bars since the last cached one (since=)
+OHLCV_INCREMENTAL_ENABLED = True
+OHLCV_INCREMENTAL_MAX_BARS = 50
+# minimum history kept per (symbol, timeframe); callers get a tail of it
+OHLCV_HISTORY_LIMIT = 300
+# Bybit returns at most 1000 candles per request
+OHLCV_FETCH_MAX_BARS = 1000
+# higher timeframes that are multiples of BASE_TIMEFRAME are aggregated from the
+# local base history (kept long enough only for symbols that need it); a direct
+# fetch happens whenever the aggregated series is shorter than requested
+OHLCV_RESAMPLE_ENABLED = True
+# cache freshness follows bar closes: closed bars are never refetched,
+# the forming bar is refreshed at most every OHLCV_FORMING_BAR_TTL_SECONDS
+OHLCV_FORMING_BAR_TTL_SECONDS = 25
+OHLCV_MIN_REFRESH_SECONDS = 5
+# parallel prefetch in engine cycles + shared token bucket for REST calls
+# (Bybit allows 600 requests / 5s per IP, we stay well below it)
+ENGINE_PREFETCH_WORKERS = 4
+EXCHANGE_RATE_LIMIT_PER_SECOND = 10.0
+EXCHANGE_RATE_LIMIT_BURST = 20
+EXCHANGE_RATE_LIMIT_RETRIES = 2
+EXCHANGE_RATE_LIMIT_BACKOFF_SECONDS = 2.0
+EXCHANGE_RATE_LIMIT_MAX_BACKOFF_SECONDS = 60.0
+# per-endpoint budgets inside the global one: (requests per second, burst)
+EXCHANGE_ENDPOINT_BUDGETS = {
+    "ohlcv": (8.0, 16),
+    "ticker": (5.0, 10),
+    "markets": (0.5, 2),
+}
+# one ccxt client per workload under the shared budget above;
+# interactive (/analyze) calls take tokens ahead of background scanning
+EXCHANGE_WORKLOADS = ("scan", "interactive", "news")
+EXCHANGE_PRIORITY_WORKLOADS = ("interactive",)
+# one bulk fetch_tickers per cycle shared by live price and spread checks
+TICKER_SNAPSHOT_TTL_SECONDS = 5
+# gap repair: missing bars are backfilled with targeted since= requests
+OHLCV_GAP_REPAIR_ENABLED = True
+OHLCV_GAP_REPAIR_MAX_RANGES = 5
+OHLCV_GAP_REPAIR_COOLDOWN_SECONDS = 60
+# rolling max/min/sum/median windows per (symbol, timeframe) for levels, swings,
+# SMA20/std20 and anomaly checks; only newly arrived bars are pushed into them
+ROLLING_WINDOWS_ENABLED = True
+# features memoized per (symbol, timeframe): closed-bar indicator state is keyed by the
+# last closed bar, a changed live bar only re-runs the O(1) live step; entries of symbols
+# that left the universe are evicted every cycle
+FEATURE_CACHE_ENABLED = True
+# candle history persisted between restarts (one binary file per symbol/timeframe)
+OHLCV_DISK_CACHE_ENABLED = True
+OHLCV_DISK_CACHE_DIR = "ohlcv_cache"
+
 # Setup logic
 SETUP_DISTANCE_PCT = 0.25
 SETUP_MIN_SCORE = 0.55
 SETUP_COOLDOWN_MINUTES = 30
 SETUP_TTL_MINUTES = 120
 
+# Tiered polling (engine v3): symbols far from any level are scanned less often
+SYMBOL_TIERS_ENABLED = True
+SYMBOL_TIER_HOT_DISTANCE_MULT = 3  # hot: level within 3 x SETUP_DISTANCE_PCT or a setup in the last SETUP_TTL_MINUTES
+SYMBOL_TIER_WARM_DISTANCE_MULT = 8
+SYMBOL_TIER_WARM_EVERY_CYCLES = 2
+SYMBOL_TIER_COLD_EVERY_CYCLES = 5
+
 # Trigger logic
 TRIGGER_BUFFER_PCT = 0.03
 TRIGGER_CONFIRM_MODE = "retest"
@@ -160,53 +248,73 @@ W_PATTERN = 0.15
 STATE_FILE = "state.json"
 state_lock = threading.Lock()
 run_now_request = {"chat_id": None}
-_OHLCV_CACHE: Dict[Tuple[str, str], Dict[str, object]] = {}
+_OHLCV_CACHE: Dict[Tuple[str, str], "OhlcvEntry"] = {}
+_OHLCV_HISTORY_LIMITS: Dict[Tuple[str, str], int] = {}
+# (symbol, timeframe) -> (базовый ряд, из которого собран, собранный ряд)
+_RESAMPLED_CACHE: Dict[Tuple[str, str], Tuple["CandleSeries", "CandleSeries"]] = {}
+_OHLCV_GAP_STATS: Dict[str, Dict[str, float]] = {}
+_INDICATOR_STREAMS_LOCK = threading.Lock()
+_BAR_WINDOWS: Dict[Tuple[str, str], BarWindows] = {}
+_FEATURE_CACHE: Dict[Tuple[str, str], Dict[str, object]] = {}
+_MTF_TREND_CACHE: Dict[str, Tuple[tuple, Optional[str]]] = {}
+_FEATURE_CACHE_STATS: Dict[str, int] = {"hits": 0, "live": 0, "full": 0, "evicted": 0}
+_OHLCV_UNRECOVERABLE_GAPS: Dict[Tuple[str, str], set] = {}
+_INFLIGHT: Dict[Tuple, Dict[str, object]] = {}
+# (ts, tickers) публикуется целиком; обновляет его только scan-клиент по своей вселенной
+_TICKER_SNAPSHOT: Tuple[float, Dict[str, Dict]] = (0.0, {})
+_TICKER_UNIVERSE: Tuple[str, ...] = ()
+_TICKER_SNAPSHOT_LOCK = threading.Lock()
+_INFLIGHT_LOCK = threading.Lock()
+_CORRELATION_STATE: Dict[str, object] = {"bar_ts": None, "requested": [], "index": {}, "matrix": None, "overlap": None}
+_CORRELATION_LOCK = threading.Lock()
+_EXCHANGE_WORKLOADS: Dict[int, str] = {}
+_SYMBOL_TIERS: Dict[str, Dict[str, object]] = {}
+_SCHEDULER_STATE: Dict[str, int] = {"cycle": 0}
+_ENGINE_V3_STAGE_COUNTS: Dict[str, int] = {}
 _LAST_RL_LOG_TS = 0.0
 MANUAL_MARKETS_CACHE_TTL = 600
 MANUAL_SYMBOL_QUOTE = "USDT"
+MARKET_INDEX_FILE = "markets_index.json"
+MARKET_INDEX_SUGGESTIONS = 5
 
 
 # ============================================================
 # RISK ENGINE (INLINE)
 # ============================================================
+# ступени плеча: <=10, <=25, <=50, выше; одни и те же таблицы для скалярной и batch-версии
+_RISK_LEVERAGE_BOUNDS = (10, 25, 50)
+_RISK_SL_ATR_MULTIPLIERS = (1.6, 1.3, 1.1, 0.9)
+_RISK_MIN_RR = (1.6, 1.8, 2.0, 2.2)
+_RISK_LIQ_HAIRCUTS = (0.90, 0.80, 0.65, 0.60)
+_RISK_LIQ_BUFFER_PCTS = (0.15, 0.22, 0.30, 0.35)
+_RISK_REASONS = (
+    "",
+    "некорректные входные данные",
+    "ATR недоступен",
+    "недостаточная дистанция до ликвидации",
+    "слишком высокий риск для выбранного плеча",
+    "SL слишком близко к ликвидации для выбранного плеча",
+)
+
+
+def _leverage_tier(leverage: float) -> int:
+    return bisect_left(_RISK_LEVERAGE_BOUNDS, leverage)
+
+
 def _sl_atr_multiplier(leverage: int) -> float:
-    if leverage <= 10:
-        return 1.6
-    if leverage <= 25:
-        return 1.3
-    if leverage <= 50:
-        return 1.1
-    return 0.9
+    return _RISK_SL_ATR_MULTIPLIERS[_leverage_tier(leverage)]
 
 
 def _min_rr(leverage: int) -> float:
-    if leverage <= 10:
-        return 1.6
-    if leverage <= 25:
-        return 1.8
-    if leverage <= 50:
-        return 2.0
-    return 2.2
+    return _RISK_MIN_RR[_leverage_tier(leverage)]
 
 
 def _liq_haircut(leverage: int) -> float:
-    if leverage <= 10:
-        return 0.90
-    if leverage <= 25:
-        return 0.80
-    if leverage <= 50:
-        return 0.65
-    return 0.60
+    return _RISK_LIQ_HAIRCUTS[_leverage_tier(leverage)]
 
 
 def _liq_buffer_pct(leverage: int) -> float:
-    if leverage <= 10:
-        return 0.15
-    if leverage <= 25:
-        return 0.22
-    if leverage <= 50:
-        return 0.30
-    return 0.35
+    return _RISK_LIQ_BUFFER_PCTS[_leverage_tier(leverage)]
 
 
 def evaluate_risk(
@@ -338,8 +446,178 @@ def evaluate_risk(
     }
 
 
+def evaluate_risk_batch(
+    directions: Sequence[str],
+    entry_prices: Sequence[float],
+    atrs: Sequence[Optional[float]],
+    swing_highs: Sequence[Optional[float]],
+    swing_lows: Sequence[Optional[float]],
+    leverages: Sequence[float],
+    position_usds: Sequence[float],
+) -> Dict[str, np.ndarray]:
+    # evaluate_risk для N кандидатов × M пар (плечо, сумма) одним векторным проходом;
+    # все массивы результата — (N, M), None из скалярной версии здесь NaN
+    def column(values) -> np.ndarray:
+        return np.array([np.nan if value is None else value for value in values], dtype=np.float64)[:, None]
+
+    is_long = np.array([direction.upper() == "LONG" for direction in directions])[:, None]
+    entry = column(entry_prices)
+    atr = column(atrs)
+    swing_high = column(swing_highs)
+    swing_low = column(swing_lows)
+    leverage = np.asarray(leverages, dtype=np.float64)[None, :]
+    position_usd = np.asarray(position_usds, dtype=np.float64)[None, :]
+    tier = np.searchsorted(_RISK_LEVERAGE_BOUNDS, leverage, side="left")
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        bad_input = (entry <= 0) | (leverage <= 0) | (position_usd <= 0)
+        bad_atr = ~(atr > 0)
+        theo_liq_price = np.where(is_long, entry * (1 - 1 / leverage), entry * (1 + 1 / leverage))
+        liq_distance = np.abs(entry - theo_liq_price) * np.take(_RISK_LIQ_HAIRCUTS, tier)
+        liq_price = np.where(is_long, entry - liq_distance, entry + liq_distance)
+        bad_liq = ~(liq_distance > 0)
+
+        buffer_distance = liq_distance * np.take(_RISK_LIQ_BUFFER_PCTS, tier)
+        min_distance = np.maximum(atr * 0.2, liq_distance * 0.1)
+        max_distance = liq_distance * 0.85
+        sl_offset = atr * np.take(_RISK_SL_ATR_MULTIPLIERS, tier)
+        liq_safe = np.where(is_long, liq_price + buffer_distance, liq_price - buffer_distance)
+        sl_struct = np.broadcast_to(np.where(is_long, swing_low, swing_high), liq_safe.shape)
+        sl_atr = np.where(is_long, entry - sl_offset, entry + sl_offset)
+
+        # кандидаты SL в том же порядке, что и в evaluate_risk: при равенстве берётся первый
+        candidates = np.stack([sl_struct, sl_atr, liq_safe])
+        distances = np.abs(entry - candidates)
+        inside = np.where(is_long, (liq_safe < candidates) & (candidates < entry), (entry < candidates) & (candidates < liq_safe))
+        valid = inside & (distances >= min_distance) & (distances <= max_distance)
+        choice = np.argmin(np.where(valid, distances, np.inf), axis=0)
+        sl = np.take_along_axis(candidates, choice[None], axis=0)[0]
+        risk_distance = np.abs(entry - sl)
+        no_candidate = ~valid.any(axis=0)
+
+        sl_to_liq = np.abs(sl - liq_price)
+        min_sl_to_liq = np.maximum(atr * 0.40, liq_distance * 0.25)
+        too_close = sl_to_liq < min_sl_to_liq
+
+        rr = np.take(_RISK_MIN_RR, tier)
+        tp = np.where(is_long, entry + risk_distance * rr, entry - risk_distance * rr)
+        notional = position_usd * leverage
+        risk_usd = notional * risk_distance / entry
+        profit_usd = notional * np.abs(tp - entry) / entry
+
+    reason_code = np.select(
+        [bad_input, bad_atr, bad_liq, no_candidate, too_close],
+        [1, 2, 3, 4, 5],
+        default=0,
+    )
+    ok = reason_code == 0
+    return {
+        "ok": ok,
+        "sl": np.where(ok, sl, np.nan),
+        "tp": np.where(ok, tp, np.nan),
+        # ликвидация не считается только при некорректных входах и без ATR
+        "liq_price": np.where(ok | (reason_code >= 3), liq_price, np.nan),
+        "risk_usd": np.where(ok, risk_usd, 0.0),
+        "profit_usd": np.where(ok, profit_usd, 0.0),
+        "reason": np.take(np.array(_RISK_REASONS, dtype=object), reason_code),
+    }
+
+
+def risk_result_at(batch: Dict[str, np.ndarray], row: int, column: int = 0) -> Dict:
+    # одна ячейка evaluate_risk_batch в формате evaluate_risk
+    def optional(name: str) -> Optional[float]:
+        value = float(batch[name][row, column])
+        return None if math.isnan(value) else value
+
+    return {
+        "ok": bool(batch["ok"][row, column]),
+        "sl": optional("sl"),
+        "tp": optional("tp"),
+        "liq_price": optional("liq_price"),
+        "risk_usd": float(batch["risk_usd"][row, column]),
+        "profit_usd": float(batch["profit_usd"][row, column]),
+        "reason": batch["reason"][row, column],
+    }
+
+
 # ============================================================
 
+# ================== HTTP ==================
+class HttpClient:
+    # один requests.Session на процесс: соединения переиспользуются между потоками
+    def __init__(
+        self,
+        host_timeouts: Dict[str, object],
+        default_timeout: object,
+        base_url_overrides: Dict[str, str],
+    ):
+        self._host_timeouts = host_timeouts
+        self._default_timeout = default_timeout
+        self._base_url_overrides = base_url_overrides
+        self._session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=HTTP_POOL_CONNECTIONS,
+            pool_maxsize=HTTP_POOL_MAXSIZE,
+        )
+        self._session.mount("https://", adapter)
+        self._session.mount("http://", adapter)
+        self._stats: Dict[str, Dict[str, float]] = {}
+        self._lock = threading.Lock()
+
+    def _resolve(self, url: str) -> Tuple[str, str]:
+        parsed = urlparse(url)
+        host = parsed.netloc
+        override = self._base_url_overrides.get(host)
+        if override:
+            url = override.rstrip("/") + url[len(f"{parsed.scheme}://{host}"):]
+        return host, url
+
+    def _record(self, host: str, elapsed: float, failed: bool) -> None:
+        with self._lock:
+            stats = self._stats.setdefault(
+                host,
+                {"requests": 0, "errors": 0, "latency_total": 0.0, "latency_max": 0.0},
+            )
+            stats["requests"] += 1
+            stats["errors"] += int(failed)
+            stats["latency_total"] += elapsed
+            stats["latency_max"] = max(stats["latency_max"], elapsed)
+
+    def request(self, method: str, url: str, timeout=None, **kwargs) -> requests.Response:
+        host, url = self._resolve(url)
+        if timeout is None:
+            timeout = self._host_timeouts.get(host, self._default_timeout)
+        started = time.monotonic()
+        try:
+            response = self._session.request(method, url, timeout=timeout, **kwargs)
+        except Exception:
+            self._record(host, time.monotonic() - started, True)
+            raise
+        self._record(host, time.monotonic() - started, response.status_code >= 400)
+        return response
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url: str, **kwargs) -> requests.Response:
+        return self.request("POST", url, **kwargs)
+
+    def stats(self) -> Dict[str, Dict[str, float]]:
+        with self._lock:
+            return {host: dict(values) for host, values in self._stats.items()}
+
+
+_HTTP = HttpClient(HTTP_HOST_TIMEOUTS, HTTP_DEFAULT_TIMEOUT, HTTP_BASE_URL_OVERRIDES)
+
+
+def get_http_stats() -> Dict[str, float]:
+    totals = {"requests": 0, "errors": 0, "latency_total": 0.0}
+    for values in _HTTP.stats().values():
+        for name in totals:
+            totals[name] += values[name]
+    return totals
+
+
 # ================== TELEGRAM ==================
 def tg_send(
     text: str,
@@ -356,7 +634,7 @@ def tg_send(
         }
         if reply_markup is not None:
             payload["reply_markup"] = reply_markup
-        r = requests.post(url, json=payload, timeout=15)
+        r = _HTTP.post(url, json=payload)
         if r.status_code != 200:
             print(f"[TG] sendMessage failed: {r.status_code} {r.text}")
             return False
@@ -383,7 +661,7 @@ def tg_edit_message(
         }
         if reply_markup is not None:
             payload["reply_markup"] = reply_markup
-        r = requests.post(url, json=payload, timeout=15)
+        r = _HTTP.post(url, json=payload)
         if r.status_code != 200:
             print(f"[TG] editMessageText failed: {r.status_code} {r.text}")
             return False
@@ -395,7 +673,7 @@ def tg_edit_message(
 
 def tg_get_updates(offset: int) -> List[Dict]:
     url = f"https://api.telegram.org/bot{TELEGRAM_BOT_TOKEN}/getUpdates"
-    r = requests.get(url, params={"offset": offset, "timeout": 15}, timeout=20)
+    r = _HTTP.get(url, params={"offset": offset, "timeout": 15}, timeout=(3, 20))
     if r.status_code != 200:
         raise RuntimeError(f"Telegram error {r.status_code}: {r.text}")
     data = r.json()
@@ -405,7 +683,7 @@ def tg_get_updates(offset: int) -> List[Dict]:
 def tg_answer_callback(callback_id: str) -> None:
     try:
         url = f"https://api.telegram.org/bot{TELEGRAM_BOT_TOKEN}/answerCallbackQuery"
-        requests.post(url, json={"callback_query_id": callback_id}, timeout=10)
+        _HTTP.post(url, json={"callback_query_id": callback_id}, timeout=(3, 10))
     except Exception as e:
         print(f"[TG] answerCallbackQuery exception: {e}")
 
@@ -562,9 +840,44 @@ def build_news_level_text(current_level: int) -> str:
     )
 
 
+def build_risk_preview_lines(position_usd: float) -> List[str]:
+    # таблица риска по сетке плеч на текущих данных BTC (только из кэша, без запросов к бирже)
+    btc_symbol = to_ccxt_symbol("BTCUSDT")
+    cached = _OHLCV_CACHE.get((btc_symbol, BASE_TIMEFRAME))
+    if not cached or not cached.series:
+        return []
+    base_data = cached.series.window(300)
+    features = build_symbol_features(btc_symbol, base_data)
+    if not features.get("atr"):
+        return []
+    price = base_data["closes"][-1]
+    swing_low, swing_high = _swing_levels(base_data, features)
+    batch = evaluate_risk_batch(
+        ["LONG", "SHORT"],
+        [price, price],
+        [features["atr"]] * 2,
+        [swing_high] * 2,
+        [swing_low] * 2,
+        RISK_PREVIEW_LEVERAGES,
+        [position_usd] * len(RISK_PREVIEW_LEVERAGES),
+    )
+
+    def cell(row: int, column: int) -> str:
+        if not batch["ok"][row, column]:
+            return "❌"
+        return f"-{format_usd(batch['risk_usd'][row, column])}/+{format_usd(batch['profit_usd'][row, column])}"
+
+    lines = [f"📊 Риск по плечам (BTC, {format_usd(position_usd)}): LONG | SHORT"]
+    for column, leverage in enumerate(RISK_PREVIEW_LEVERAGES):
+        lines.append(f"{leverage}x: {cell(0, column)} | {cell(1, column)}")
+    return lines
+
+
 def build_settings_text(state: Dict) -> str:
     settings = get_settings_snapshot(state)
     enabled_count = get_combined_symbol_count(state)
+    preview_lines = build_risk_preview_lines(float(settings["position_usd"]))
+    preview = "━━━━━━━━━━━━━━━━\n" + "\n".join(preview_lines) + "\n" if preview_lines else ""
     return (
         "⚙️ Настройки\n"
         "━━━━━━━━━━━━━━━━\n"
@@ -572,6 +885,7 @@ def build_settings_text(state: Dict) -> str:
         f"💰 Сумма: {format_usd(settings['position_usd'])}\n"
         f"🎯 Мин. уверенность: {settings['min_confidence']}%\n"
         f"🪙 Активов в анализе: {enabled_count}\n"
+        f"{preview}"
         "━━━━━━━━━━━━━━━━"
     )
 
@@ -837,6 +1151,160 @@ def compute_display_probability(
     return clamp(fallback, 0.01, 0.95)
 
 
+class MarketIndex:
+    # компактный индекс рынков Bybit: (base, quote, type) -> ccxt symbol,
+    # хранится на диске и обновляется в фоне, чтобы /analyze не ждал load_markets
+    TYPE_PRIORITY = ("swap", "spot", "future")
+
+    def __init__(self, path: str, ttl_seconds: int):
+        self._path = path
+        self._ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._refreshing = False
+        self.ts = 0.0
+        self._by_pair: Dict[Tuple[str, str], Dict[str, str]] = {}
+        self._symbols: set = set()
+        self._quotes: List[str] = []
+        # (отсортированные ключи base+quote, символы в том же порядке)
+        self._prefix: Tuple[List[str], List[str]] = ([], [])
+
+    def __len__(self) -> int:
+        return len(self._symbols)
+
+    def is_stale(self) -> bool:
+        return time.time() - self.ts >= self._ttl_seconds
+
+    def load(self) -> bool:
+        try:
+            with open(self._path, "r", encoding="utf-8") as f:
+                payload = json.load(f)
+        except Exception:
+            return False
+        self._build(payload.get("markets", []), float(payload.get("ts", 0.0)))
+        return bool(self._symbols)
+
+    def refresh(self, exchange: ccxt.bybit) -> None:
+        # reload=True: иначе ccxt вернёт рынки, уже загруженные этим клиентом, и новые листинги не появятся
+        markets = _call_exchange("markets", "load_markets manual", lambda: exchange.load_markets(True), exchange)
+        entries = [
+            {
+                "symbol": market.get("symbol") or symbol,
+                "base": market.get("base"),
+                "quote": market.get("quote"),
+                "type": market.get("type"),
+            }
+            for symbol, market in (markets or {}).items()
+            if market.get("active", True) is not False
+        ]
+        now = time.time()
+        self._build(entries, now)
+        try:
+            tmp_path = f"{self._path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"ts": now, "markets": entries}, f, ensure_ascii=False)
+            os.replace(tmp_path, self._path)
+        except Exception as e:
+            print(f"[MANUAL] market index write error: {e}")
+
+    def refresh_in_background(self, exchange: ccxt.bybit) -> None:
+        with self._lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+
+        def _run() -> None:
+            try:
+                self.refresh(exchange)
+            except Exception as e:
+                if _is_rate_limit_error(e):
+                    _log_rate_limit_once("load_markets manual")
+                print(f"[MANUAL] market index refresh error: {e}")
+            finally:
+                with self._lock:
+                    self._refreshing = False
+
+        threading.Thread(target=_run, daemon=True).start()
+
+    def _build(self, entries: List[Dict], ts: float) -> None:
+        by_pair: Dict[Tuple[str, str], Dict[str, str]] = {}
+        symbols = set()
+        quotes = set()
+        prefix = {}
+        for entry in entries:
+            symbol = entry.get("symbol")
+            base = str(entry.get("base") or "").upper()
+            quote = str(entry.get("quote") or "").upper()
+            if not symbol or not base or not quote:
+                continue
+            by_pair.setdefault((base, quote), {})[entry.get("type") or "spot"] = symbol
+            symbols.add(symbol)
+            quotes.add(quote)
+        for (base, quote), by_type in by_pair.items():
+            prefix[f"{base}{quote}"] = self._pick(by_type)
+        prefix_keys = sorted(prefix)
+        # ключи и символы публикуются одним кортежем, чтобы читатель не смешал старые с новыми
+        self._prefix = (prefix_keys, [prefix[key] for key in prefix_keys])
+        self._quotes = sorted(quotes, key=len, reverse=True)
+        self._by_pair = by_pair
+        self._symbols = symbols
+        self.ts = ts
+
+    def _pick(self, by_type: Dict[str, str], market_type: Optional[str] = None) -> Optional[str]:
+        if market_type:
+            return by_type.get(market_type)
+        for preferred in self.TYPE_PRIORITY:
+            if preferred in by_type:
+                return by_type[preferred]
+        return next(iter(by_type.values()), None)
+
+    def _split(self, raw: str) -> Optional[Tuple[str, str, Optional[str]]]:
+        cleaned = (raw or "").strip().upper()
+        market_type = None
+        if ":" in cleaned:
+            cleaned = cleaned.split(":", 1)[0]
+            market_type = "swap"
+        parts = [part for part in re.split(r"[\s/\-_]+", cleaned) if part]
+        if len(parts) == 2:
+            return parts[0], parts[1], market_type
+        if len(parts) != 1:
+            return None
+        compact = parts[0]
+        for quote in self._quotes:
+            if compact.endswith(quote) and len(compact) > len(quote):
+                return compact[: -len(quote)], quote, market_type
+        return None
+
+    def resolve(self, raw: str) -> Optional[str]:
+        if raw in self._symbols:
+            return raw
+        parsed = self._split(raw)
+        if not parsed:
+            return None
+        base, quote, market_type = parsed
+        by_type = self._by_pair.get((base, quote))
+        if not by_type:
+            return None
+        return self._pick(by_type, market_type)
+
+    def suggest(self, raw: str, limit: int = MARKET_INDEX_SUGGESTIONS) -> List[str]:
+        cleaned = (raw or "").upper().split(":", 1)[0]
+        # сначала по всей строке, затем только по base (BT/USDT -> BTC..., BTT...)
+        for candidate in (cleaned, re.split(r"[\s/\-_]+", cleaned.strip())[0]):
+            key = re.sub(r"[^A-Z0-9]", "", candidate)
+            if not key:
+                continue
+            keys, symbols = self._prefix
+            start = bisect_left(keys, key)
+            result = []
+            for index in range(start, min(start + limit, len(keys))):
+                if not keys[index].startswith(key):
+                    break
+                result.append(symbols[index])
+            if result:
+                return result
+        return []
+
+
 class ManualMemoryEngine:
     def __init__(
         self,
@@ -851,7 +1319,13 @@ class ManualMemoryEngine:
         self._state_saver = state_saver
         self._logger = logger
         self._caches = caches
-        self._caches.setdefault("markets", {"ts": 0.0, "symbols": set()})
+        if "market_index" not in self._caches:
+            market_index = MarketIndex(MARKET_INDEX_FILE, MANUAL_MARKETS_CACHE_TTL)
+            market_index.load()
+            if market_index.is_stale():
+                market_index.refresh_in_background(exchange)
+            self._caches["market_index"] = market_index
+        self._market_index: MarketIndex = self._caches["market_index"]
 
     def _log(self, message: str) -> None:
         if self._logger:
@@ -884,17 +1358,16 @@ class ManualMemoryEngine:
             return f"{base}/{MANUAL_SYMBOL_QUOTE}"
         return ""
 
-    def _load_markets_cached(self) -> Optional[set]:
-        cache = self._caches.setdefault("markets", {"ts": 0.0, "symbols": set()})
-        now = time.time()
-        if cache.get("symbols") and now - float(cache.get("ts", 0.0)) < MANUAL_MARKETS_CACHE_TTL:
-            return cache.get("symbols")
+    def _load_market_index(self) -> Optional[MarketIndex]:
+        index = self._market_index
+        if len(index):
+            # индекс с диска отвечает сразу, свежесть догоняется в фоне
+            if index.is_stale():
+                index.refresh_in_background(self.exchange)
+            return index
         try:
-            markets = self.exchange.load_markets()
-            symbols = set(self.exchange.symbols or markets.keys())
-            cache["symbols"] = symbols
-            cache["ts"] = now
-            return symbols
+            index.refresh(self.exchange)
+            return index
         except Exception as e:
             if _is_rate_limit_error(e):
                 _log_rate_limit_once("load_markets manual")
@@ -902,18 +1375,16 @@ class ManualMemoryEngine:
             return None
 
     def validate_symbol_exists(self, symbol: str) -> Tuple[bool, Optional[str]]:
-        symbols = self._load_markets_cached()
-        if symbols is None:
+        index = self._load_market_index()
+        if index is None:
             return False, "Не удалось проверить пару на Bybit. Попробуй позже."
-        candidates = {symbol, to_ccxt_manual_symbol(symbol)}
-        if symbol.endswith(f"/{MANUAL_SYMBOL_QUOTE}"):
-            candidates.add(f"{symbol}:{MANUAL_SYMBOL_QUOTE}")
-        if any(candidate in symbols for candidate in candidates):
+        if index.resolve(symbol) or index.resolve(to_ccxt_manual_symbol(symbol)):
             return True, None
-        return (
-            False,
-            f"Пара {symbol} не найдена на Bybit. Проверь формат (пример: BTC/USDT) и попробуй снова.",
-        )
+        message = f"Пара {symbol} не найдена на Bybit. Проверь формат (пример: BTC/USDT) и попробуй снова."
+        suggestions = index.suggest(symbol)
+        if suggestions:
+            message += "\nВозможно: " + ", ".join(item.split(":", 1)[0] for item in suggestions)
+        return False, message
 
     def add_symbol(self, symbol: str) -> bool:
         with state_lock:
@@ -1009,29 +1480,19 @@ class ManualMemoryEngine:
             if ENGINE_VERSION == 3:
                 return engine_v3_analyze(self.exchange, self._get_state(), ccxt_symbol)
             if ENGINE_VERSION == 2:
-                base_parsed = fetch_ohlcv_cached(
+                base_data = fetch_ohlcv_cached(
                     self.exchange,
                     ccxt_symbol,
                     BASE_TIMEFRAME,
                     limit=300,
-                    ttl_seconds=25,
+                    ttl_seconds=OHLCV_FORMING_BAR_TTL_SECONDS,
                 )
-                if not base_parsed:
+                if not base_data:
                     return {"status": "error", "error": "Данные недоступны."}
-                base_data = _parsed_to_dict(base_parsed)
                 if len(base_data["closes"]) < 220:
                     return {"status": "none"}
-                higher_data = None
-                if ENGINE_V2_USE_MTF:
-                    higher_parsed = fetch_ohlcv_cached(
-                        self.exchange,
-                        ccxt_symbol,
-                        HIGHER_TIMEFRAME,
-                        limit=300,
-                        ttl_seconds=600,
-                    )
-                    higher_data = _parsed_to_dict(higher_parsed) if higher_parsed else None
-                features = build_features(base_data)
+                higher_data = higher_data_loader(self.exchange, ccxt_symbol)
+                features = build_symbol_features(ccxt_symbol, base_data)
                 if not features:
                     return {"status": "none"}
                 regime = detect_regime(features)
@@ -1061,10 +1522,7 @@ class ManualMemoryEngine:
                 if best_entry:
                     settings = get_settings_snapshot(self._get_state())
                     atr_val = features.get("atr")
-                    lows = base_data["lows"]
-                    highs = base_data["highs"]
-                    swing_low = min(lows[-20:]) if len(lows) >= 20 else min(lows)
-                    swing_high = max(highs[-20:]) if len(highs) >= 20 else max(highs)
+                    swing_low, swing_high = _swing_levels(base_data, features)
                     risk_result = evaluate_risk(
                         direction=best_entry["setup"]["direction"],
                         entry_price=best_entry["entry"]["entry_price"],
@@ -1134,6 +1592,13 @@ def handle_command(text: str, chat_id: int, state: Dict, manual_engine: ManualMe
 
     if command == "/status":
         settings = get_settings_snapshot(state)
+        rl_stats = get_rate_limit_stats()
+        http_stats = get_http_stats()
+        tier_counts = get_symbol_tier_counts()
+        gap_stats = get_gap_stats()
+        feature_stats = get_feature_cache_stats()
+        stage_counts = get_engine_v3_stage_counts()
+        http_avg_ms = http_stats["latency_total"] / http_stats["requests"] * 1000 if http_stats["requests"] else 0.0
         tg_send(
             "🧠 Статус системы\n"
             "━━━━━━━━━━━━━━━━\n"
@@ -1141,6 +1606,17 @@ def handle_command(text: str, chat_id: int, state: Dict, manual_engine: ManualMe
             f"⏱ Таймфрейм: {TIMEFRAME}\n"
             f"🔄 Проверка: каждые {CHECK_EVERY_SECONDS} сек\n"
             f"🎯 Мин. уверенность: {settings['min_confidence']}%\n"
+            f"🚦 API: запросов {int(rl_stats['requests'])}, лимитов {int(rl_stats['rate_limited'])}, "
+            f"повторов {int(rl_stats['retries'])}, отложено {int(rl_stats['deferred'])}\n"
+            f"🌐 HTTP: запросов {int(http_stats['requests'])}, ошибок {int(http_stats['errors'])}, "
+            f"ср. задержка {http_avg_ms:.0f} мс\n"
+            f"🩹 Дыры в свечах: закрыто {int(gap_stats['repaired'])}, невосстановимо {int(gap_stats['unrecoverable'])}\n"
+            f"🌡 Тиры: hot {tier_counts['hot']} / warm {tier_counts['warm']} / cold {tier_counts['cold']}\n"
+            f"🧮 Кэш признаков: {feature_stats['size']} рядов, попаданий {feature_stats['hits']}, "
+            f"живой бар {feature_stats['live']}, полный расчёт {feature_stats['full']}\n"
+            f"🔎 Воронка v3: {stage_counts.get('symbols', 0)} → данные {stage_counts.get('data', 0)} → "
+            f"префильтр {stage_counts.get('prefilter', 0)} → целостность {stage_counts.get('integrity', 0)} → "
+            f"сетапы {stage_counts.get('setups', 0)} → входы {stage_counts.get('entries', 0)}\n"
             "━━━━━━━━━━━━━━━━",
             chat_id=chat_id,
         )
@@ -1533,10 +2009,9 @@ def prune_translation_cache(cache: Dict[str, str]) -> None:
 
 def _translate_title_mymemory(title_en: str) -> Optional[str]:
     try:
-        response = requests.get(
+        response = _HTTP.get(
             "https://api.mymemory.translated.net/get",
             params={"q": title_en, "langpair": f"en|{NEWS_TRANSLATE_TARGET}"},
-            timeout=NEWS_TRANSLATE_TIMEOUT,
         )
         if response.status_code != 200:
             return None
@@ -1683,10 +2158,10 @@ def compute_urgency(item: NewsItem, repeated_count: int) -> int:
 
 
 def get_price_change_1h(exchange: ccxt.bybit, symbol: str) -> Optional[str]:
-    parsed = fetch_ohlcv_cached(exchange, symbol, "1h", limit=2, ttl_seconds=120)
-    if not parsed:
+    series = fetch_ohlcv_cached(exchange, symbol, "1h", limit=2, ttl_seconds=120)
+    if not series:
         return None
-    closes = parsed[2]
+    closes = series["closes"]
     if len(closes) < 2 or closes[-2] == 0:
         return None
     pct = (closes[-1] - closes[-2]) / closes[-2] * 100
@@ -1701,11 +2176,10 @@ def fetch_news_from_provider(provider_name: str, since_ts: int, limit: int) -> L
         else:
             params["public"] = "true"
         try:
-            response = requests.get(
+            response = _HTTP.get(
                 CRYPTOPANIC_ENDPOINT,
                 params=params,
                 headers=NEWS_HTTP_HEADERS,
-                timeout=NEWS_HTTP_TIMEOUT_API,
             )
             if response.status_code != 200:
                 return []
@@ -1719,7 +2193,7 @@ def fetch_news_from_provider(provider_name: str, since_ts: int, limit: int) -> L
         items: List[Dict] = []
         for feed_url in RSS_FEEDS:
             try:
-                response = requests.get(
+                response = _HTTP.get(
                     feed_url,
                     headers=NEWS_HTTP_HEADERS,
                     timeout=NEWS_HTTP_TIMEOUT_RSS,
@@ -1768,11 +2242,10 @@ def fetch_news_from_provider(provider_name: str, since_ts: int, limit: int) -> L
             "format": "json",
         }
         try:
-            response = requests.get(
+            response = _HTTP.get(
                 GDELT_DOC_ENDPOINT,
                 params=params,
                 headers=NEWS_HTTP_HEADERS,
-                timeout=NEWS_HTTP_TIMEOUT_API,
             )
             if response.status_code != 200:
                 return []
@@ -2239,7 +2712,7 @@ def run_news_test(chat_id: int, state: Dict) -> None:
 
 
 # ================== INDICATORS ==================
-def ema(values: List[float], period: int) -> List[float]:
+def ema(values: Sequence[float], period: int) -> List[float]:
     k = 2 / (period + 1)
     out = [values[0]]
     for v in values[1:]:
@@ -2247,7 +2720,7 @@ def ema(values: List[float], period: int) -> List[float]:
     return out
 
 
-def rsi(values: List[float], period: int = 14) -> List[float]:
+def rsi(values: Sequence[float], period: int = 14) -> List[float]:
     gains = []
     losses = []
     for i in range(1, len(values)):
@@ -2275,10 +2748,7 @@ def rsi(values: List[float], period: int = 14) -> List[float]:
     return rsi_vals
 
 
-def atr(highs: List[float], lows: List[float], closes: List[float], period: int = 14) -> Optional[float]:
-    if len(closes) < period + 1:
-        return None
-
+def true_ranges(highs: Sequence[float], lows: Sequence[float], closes: Sequence[float]) -> List[float]:
     trs = []
     for i in range(1, len(closes)):
         tr = max(
@@ -2287,39 +2757,39 @@ def atr(highs: List[float], lows: List[float], closes: List[float], period: int
             abs(lows[i] - closes[i - 1]),
         )
         trs.append(tr)
+    return trs
 
-    if len(trs) < period:
-        return None
 
-    atr_value = sum(trs[:period]) / period
-    for tr in trs[period:]:
-        atr_value = (atr_value * (period - 1) + tr) / period
-    return atr_value
-
-
-def adx(highs: List[float], lows: List[float], closes: List[float], period: int = 14) -> Optional[float]:
-    if len(closes) < (period * 2) + 1:
-        return None
-
-    trs = []
+def directional_movement(highs: Sequence[float], lows: Sequence[float]) -> Tuple[List[float], List[float]]:
     plus_dm = []
     minus_dm = []
-    for i in range(1, len(closes)):
+    for i in range(1, len(highs)):
         up_move = highs[i] - highs[i - 1]
         down_move = lows[i - 1] - lows[i]
         plus_dm.append(up_move if up_move > down_move and up_move > 0 else 0.0)
         minus_dm.append(down_move if down_move > up_move and down_move > 0 else 0.0)
-        trs.append(
-            max(
-                highs[i] - lows[i],
-                abs(highs[i] - closes[i - 1]),
-                abs(lows[i] - closes[i - 1]),
-            )
-        )
+    return plus_dm, minus_dm
 
+
+def atr_from_true_range(trs: Sequence[float], period: int = 14) -> Optional[float]:
     if len(trs) < period:
         return None
 
+    atr_value = sum(trs[:period]) / period
+    for tr in trs[period:]:
+        atr_value = (atr_value * (period - 1) + tr) / period
+    return atr_value
+
+
+def adx_from_components(
+    trs: Sequence[float],
+    plus_dm: Sequence[float],
+    minus_dm: Sequence[float],
+    period: int = 14,
+) -> Optional[float]:
+    if len(trs) < period * 2:
+        return None
+
     tr_smooth = sum(trs[:period])
     plus_smooth = sum(plus_dm[:period])
     minus_smooth = sum(minus_dm[:period])
@@ -2349,6 +2819,19 @@ def adx(highs: List[float], lows: List[float], closes: List[float], period: int
     return adx_value
 
 
+def atr(highs: Sequence[float], lows: Sequence[float], closes: Sequence[float], period: int = 14) -> Optional[float]:
+    if len(closes) < period + 1:
+        return None
+    return atr_from_true_range(true_ranges(highs, lows, closes), period)
+
+
+def adx(highs: Sequence[float], lows: Sequence[float], closes: Sequence[float], period: int = 14) -> Optional[float]:
+    if len(closes) < (period * 2) + 1:
+        return None
+    plus_dm, minus_dm = directional_movement(highs, lows)
+    return adx_from_components(true_ranges(highs, lows, closes), plus_dm, minus_dm, period)
+
+
 # ================== DATA LAYER ==================
 def _is_rate_limit_error(exc: Exception) -> bool:
     message = str(exc).lower()
@@ -2368,53 +2851,851 @@ def _log_rate_limit_once(context: str) -> None:
         _LAST_RL_LOG_TS = now
 
 
+class TokenBucket:
+    def __init__(self, rate_per_second: float, burst: int):
+        self.rate = float(rate_per_second)
+        self.capacity = float(burst)
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._priority_waiting = 0
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float) -> None:
+        if now < self._paused_until:
+            self._updated = now
+            return
+        start = max(self._updated, self._paused_until)
+        self._tokens = min(self.capacity, self._tokens + (now - start) * self.rate)
+        self._updated = now
+
+    def acquire(self, priority: bool = False) -> None:
+        # пока ждёт приоритетный поток, обычные не забирают токены
+        if priority:
+            with self._lock:
+                self._priority_waiting += 1
+        try:
+            while True:
+                with self._lock:
+                    now = time.monotonic()
+                    self._refill(now)
+                    yielding = not priority and self._priority_waiting > 0
+                    if not yielding and now >= self._paused_until and self._tokens >= 1:
+                        self._tokens -= 1
+                        return
+                    if now < self._paused_until:
+                        wait = self._paused_until - now
+                    else:
+                        wait = max(1 - self._tokens, 0.0) / self.rate
+                    if yielding:
+                        wait = max(wait, 0.01)
+                time.sleep(wait)
+        finally:
+            if priority:
+                with self._lock:
+                    self._priority_waiting -= 1
+
+    def penalize(self, seconds: float) -> None:
+        # после 429 останавливаем выдачу токенов для всех потоков
+        with self._lock:
+            now = time.monotonic()
+            self._paused_until = max(self._paused_until, now + seconds)
+            self._tokens = 0.0
+
+
+class RateGovernor:
+    STAT_KEYS = ("requests", "rate_limited", "retries", "errors", "deferred", "wait_seconds")
+
+    def __init__(self, rate_per_second: float, burst: int, endpoint_budgets: Dict[str, Tuple[float, int]]):
+        self._global = TokenBucket(rate_per_second, burst)
+        self._buckets = {
+            endpoint: TokenBucket(rate, endpoint_burst)
+            for endpoint, (rate, endpoint_burst) in endpoint_budgets.items()
+        }
+        self._stats: Dict[str, Dict[str, float]] = {}
+        self._rate_limited_symbols: set = set()
+        self._lock = threading.Lock()
+
+    def record(self, endpoint: str, key: str, value: float = 1) -> None:
+        with self._lock:
+            stats = self._stats.setdefault(endpoint, {name: 0 for name in self.STAT_KEYS})
+            stats[key] = stats.get(key, 0) + value
+
+    def acquire(self, endpoint: str, priority: bool = False) -> None:
+        started = time.monotonic()
+        bucket = self._buckets.get(endpoint)
+        if bucket is not None:
+            bucket.acquire(priority)
+        self._global.acquire(priority)
+        self.record(endpoint, "requests")
+        self.record(endpoint, "wait_seconds", time.monotonic() - started)
+
+    def backoff(self, endpoint: str, seconds: float) -> None:
+        bucket = self._buckets.get(endpoint)
+        if bucket is not None:
+            bucket.penalize(seconds)
+        self._global.penalize(seconds)
+
+    def mark_rate_limited(self, symbol: str) -> None:
+        with self._lock:
+            self._rate_limited_symbols.add(symbol)
+
+    def is_rate_limited(self, symbol: str) -> bool:
+        with self._lock:
+            return symbol in self._rate_limited_symbols
+
+    def take_rate_limited(self, symbol: str) -> bool:
+        with self._lock:
+            if symbol in self._rate_limited_symbols:
+                self._rate_limited_symbols.discard(symbol)
+                return True
+            return False
+
+    def clear_rate_limited(self, symbols: List[str]) -> None:
+        with self._lock:
+            self._rate_limited_symbols.difference_update(symbols)
+
+    def stats(self) -> Dict[str, Dict[str, float]]:
+        with self._lock:
+            return {endpoint: dict(values) for endpoint, values in self._stats.items()}
+
+
+_RATE_GOVERNOR = RateGovernor(
+    EXCHANGE_RATE_LIMIT_PER_SECOND,
+    EXCHANGE_RATE_LIMIT_BURST,
+    EXCHANGE_ENDPOINT_BUDGETS,
+)
+
+
+def build_exchange_pool() -> Dict[str, ccxt.bybit]:
+    # отдельный клиент (и HTTP-сессия) на каждый тип нагрузки; общий бюджет
+    # держит _RATE_GOVERNOR, поэтому встроенный throttle ccxt отключён
+    pool = {}
+    for workload in EXCHANGE_WORKLOADS:
+        exchange = ccxt.bybit({
+            "apiKey": BYBIT_API_KEY,
+            "secret": BYBIT_API_SECRET,
+            "enableRateLimit": False,
+            "options": {"defaultType": "swap"},  # фьючерсы (USDT Perpetual)
+        })
+        _EXCHANGE_WORKLOADS[id(exchange)] = workload
+        pool[workload] = exchange
+    return pool
+
+
+def ensure_markets_loaded(exchange: ccxt.bybit) -> None:
+    # без рынков ccxt сам вызывает load_markets() внутри fetch_* — без блокировки и мимо
+    # _RATE_GOVERNOR, так что на холодном старте каждый поток prefetch грузил бы их заново
+    if exchange.markets:
+        return
+    _single_flight(
+        ("markets", id(exchange)),
+        lambda: _call_exchange("markets", "load_markets", exchange.load_markets, exchange),
+    )
+
+
+def share_exchange_markets(pool: Dict[str, ccxt.bybit]) -> None:
+    # рынки грузятся один раз на scan-клиенте, остальные клиенты получают копию
+    source = pool[EXCHANGE_WORKLOADS[0]]
+    try:
+        ensure_markets_loaded(source)
+    except Exception as e:
+        print(f"[DATA] load_markets error: {e}")
+        return
+    for exchange in pool.values():
+        if exchange is not source:
+            exchange.set_markets(source.markets, source.currencies)
+
+
+def get_rate_limit_stats() -> Dict[str, float]:
+    totals = {name: 0.0 for name in RateGovernor.STAT_KEYS}
+    for values in _RATE_GOVERNOR.stats().values():
+        for name, value in values.items():
+            totals[name] = totals.get(name, 0.0) + value
+    return totals
+
+
+def _retry_after_seconds(exchange: Optional[ccxt.bybit]) -> Optional[float]:
+    # Bybit присылает X-Bapi-Limit-Reset-Timestamp (ms), прокси — Retry-After (s)
+    headers = getattr(exchange, "last_response_headers", None) or {}
+    for key, value in headers.items():
+        name = str(key).lower()
+        try:
+            if name == "retry-after":
+                return float(value)
+            if name == "x-bapi-limit-reset-timestamp":
+                return float(value) / 1000 - time.time()
+        except (TypeError, ValueError):
+            continue
+    return None
+
+
+def _call_exchange(endpoint: str, context: str, fn, exchange: Optional[ccxt.bybit] = None):
+    priority = _EXCHANGE_WORKLOADS.get(id(exchange)) in EXCHANGE_PRIORITY_WORKLOADS
+    for attempt in range(EXCHANGE_RATE_LIMIT_RETRIES + 1):
+        _RATE_GOVERNOR.acquire(endpoint, priority)
+        try:
+            return fn()
+        except Exception as e:
+            if not _is_rate_limit_error(e):
+                _RATE_GOVERNOR.record(endpoint, "errors")
+                raise
+            _RATE_GOVERNOR.record(endpoint, "rate_limited")
+            if attempt >= EXCHANGE_RATE_LIMIT_RETRIES:
+                raise
+            _log_rate_limit_once(context)
+            delay = EXCHANGE_RATE_LIMIT_BACKOFF_SECONDS * (2 ** attempt)
+            retry_after = _retry_after_seconds(exchange)
+            if retry_after is not None and retry_after > delay:
+                delay = retry_after
+            _RATE_GOVERNOR.backoff(endpoint, min(delay, EXCHANGE_RATE_LIMIT_MAX_BACKOFF_SECONDS))
+            _RATE_GOVERNOR.record(endpoint, "retries")
+    return None
+
+
+def iter_symbols_with_retries(symbols: List[str], deferred: List[str]):
+    # символы, упёршиеся в rate limit, повторяем в конце того же цикла (один раз);
+    # отметку в первом проходе не снимаем — по ней тело цикла не перезапрашивает символ
+    yield from symbols
+    index = 0
+    while index < len(deferred):
+        symbol = deferred[index]
+        index += 1
+        _RATE_GOVERNOR.take_rate_limited(symbol)
+        yield symbol
+
+
+def defer_if_rate_limited(symbol: str, deferred: List[str]) -> bool:
+    # deferred за цикл только растёт, так что символ откладывается и считается один раз
+    if not _RATE_GOVERNOR.take_rate_limited(symbol) or symbol in deferred:
+        return False
+    deferred.append(symbol)
+    _RATE_GOVERNOR.record("scheduler", "deferred")
+    return True
+
+
+def _single_flight(key: Tuple, fn):
+    # параллельные запросы с одинаковым ключом ждут один общий вызов
+    with _INFLIGHT_LOCK:
+        call = _INFLIGHT.get(key)
+        is_leader = call is None
+        if is_leader:
+            call = {"event": threading.Event(), "result": None, "error": None}
+            _INFLIGHT[key] = call
+    if not is_leader:
+        call["event"].wait()
+        if call["error"] is not None:
+            raise call["error"]
+        return call["result"]
+    try:
+        call["result"] = fn()
+    except Exception as e:
+        call["error"] = e
+        raise
+    finally:
+        with _INFLIGHT_LOCK:
+            _INFLIGHT.pop(key, None)
+        call["event"].set()
+    return call["result"]
+
+
+def fetch_ticker_shared(exchange: ccxt.bybit, symbol: str) -> Dict:
+    return _single_flight(
+        ("ticker", symbol),
+        lambda: _call_exchange(
+            "ticker",
+            f"fetch_ticker {symbol}",
+            lambda: exchange.fetch_ticker(symbol),
+            exchange,
+        ),
+    )
+
+
+def set_ticker_universe(symbols: List[str]) -> None:
+    global _TICKER_UNIVERSE
+    with _TICKER_SNAPSHOT_LOCK:
+        _TICKER_UNIVERSE = tuple(symbols)
+
+
+def _refresh_ticker_snapshot(exchange: ccxt.bybit) -> Dict[str, Dict]:
+    global _TICKER_SNAPSHOT
+    with _TICKER_SNAPSHOT_LOCK:
+        universe = list(_TICKER_UNIVERSE)
+    tickers: Dict[str, Dict] = {}
+    for market_type, group in _group_by_market_type(exchange, universe).items():
+        try:
+            tickers.update(_call_exchange(
+                "ticker",
+                f"fetch_tickers {market_type}",
+                lambda: exchange.fetch_tickers(group),
+                exchange,
+            ) or {})
+        except Exception as e:
+            if _is_rate_limit_error(e):
+                raise
+            print(f"[DATA] fetch_tickers error ({market_type}): {e}")
+    with _TICKER_SNAPSHOT_LOCK:
+        _TICKER_SNAPSHOT = (time.time(), tickers)
+    return tickers
+
+
+def fetch_ticker_snapshot(exchange: ccxt.bybit, symbol: str) -> Dict:
+    with _TICKER_SNAPSHOT_LOCK:
+        snapshot_ts, tickers = _TICKER_SNAPSHOT
+        in_universe = symbol in _TICKER_UNIVERSE
+    if time.time() - snapshot_ts < TICKER_SNAPSHOT_TTL_SECONDS and symbol in tickers:
+        return tickers[symbol]
+    # символ вне вселенной или запрос не от scan-клиента (/analyze) — только этот тикер
+    if not in_universe or _EXCHANGE_WORKLOADS.get(id(exchange), "scan") != "scan":
+        return fetch_ticker_shared(exchange, symbol)
+    if time.time() - snapshot_ts >= TICKER_SNAPSHOT_TTL_SECONDS:
+        tickers = _single_flight(("tickers",), lambda: _refresh_ticker_snapshot(exchange))
+    if symbol in tickers:
+        return tickers[symbol]
+    return fetch_ticker_shared(exchange, symbol)
+
+
+def _group_by_market_type(exchange: ccxt.bybit, symbols: List[str]) -> Dict[str, List[str]]:
+    # bybit отдаёт tickers только одного типа рынка за запрос, а незнакомый символ
+    # валит весь запрос: делим по типу, неизвестные символы берутся поштучно
+    markets = getattr(exchange, "markets", None) or {}
+    if not markets:
+        return {"all": symbols}
+    groups: Dict[str, List[str]] = {}
+    for symbol in symbols:
+        market = markets.get(symbol)
+        if market:
+            groups.setdefault(str(market.get("type")), []).append(symbol)
+    return groups
+
+
+class CandleSeries:
+    # колонки лежат в array (8 байт на значение), окна — memoryview без копий;
+    # после создания массивы не меняются, merge() строит новый объект
+    __slots__ = ("timestamps", "opens", "highs", "lows", "closes", "volumes")
+    COLUMNS = ("timestamps", "opens", "highs", "lows", "closes", "volumes")
+
+    def __init__(self, timestamps, opens, highs, lows, closes, volumes):
+        self.timestamps = timestamps
+        self.opens = opens
+        self.highs = highs
+        self.lows = lows
+        self.closes = closes
+        self.volumes = volumes
+
+    @classmethod
+    def empty(cls) -> "CandleSeries":
+        return cls(array("q"), array("d"), array("d"), array("d"), array("d"), array("d"))
+
+    @classmethod
+    def from_rows(cls, rows: List[List[float]]) -> "CandleSeries":
+        return cls.empty().merge(rows, len(rows))
+
+    @classmethod
+    def from_flat(cls, values: array) -> "CandleSeries":
+        return cls(
+            array("q", (int(value) for value in values[0::6])),
+            values[1::6],
+            values[2::6],
+            values[3::6],
+            values[4::6],
+            values[5::6],
+        )
+
+    def __len__(self) -> int:
+        return len(self.timestamps)
+
+    def __getitem__(self, key: str):
+        if key not in self.COLUMNS:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def get(self, key: str, default=None):
+        if key not in self.COLUMNS:
+            return default
+        return getattr(self, key)
+
+    def columns(self) -> List:
+        return [getattr(self, name) for name in self.COLUMNS]
+
+    def window(self, limit: int) -> "CandleSeries":
+        start = max(len(self) - limit, 0)
+        return CandleSeries(*[memoryview(column)[start:] for column in self.columns()])
+
+    def merge(self, rows: List[List[float]], limit: int) -> "CandleSeries":
+        if not rows:
+            return self
+        # всё, что начиная с первого нового бара, заменяем (включая формирующийся бар)
+        cut = bisect_left(self.timestamps, rows[0][0])
+        merged = []
+        for index, column in enumerate(self.columns()):
+            typecode = "q" if index == 0 else "d"
+            values = array(typecode, column[:cut])
+            if index == 0:
+                values.extend(int(row[0]) for row in rows)
+            else:
+                values.extend(float(row[index] or 0.0) for row in rows)
+            merged.append(values[-limit:] if len(values) > limit else values)
+        return CandleSeries(*merged)
+
+    def resample(self, timeframe_ms: int, base_ms: int) -> "CandleSeries":
+        # бары группируются по началу старшего бара; последний (формирующийся) остаётся, как у биржи.
+        # Бакет без полного набора базовых баров (дыра в истории, неполный первый) даёт неверные
+        # high/low/volume — история до него включительно отбрасывается
+        result = CandleSeries.empty()
+        timestamps = self.timestamps
+        opens, highs, lows, closes, volumes = self.opens, self.highs, self.lows, self.closes, self.volumes
+        factor = timeframe_ms // base_ms
+        count = len(timestamps)
+        index = 0
+        while index < count:
+            bucket = timestamps[index] - timestamps[index] % timeframe_ms
+            end = index + 1
+            while end < count and timestamps[end] < bucket + timeframe_ms:
+                end += 1
+            expected = factor if end < count else (timestamps[end - 1] - bucket) // base_ms + 1
+            if timestamps[index] != bucket or end - index != expected:
+                result = CandleSeries.empty()
+                index = end
+                continue
+            result.timestamps.append(bucket)
+            result.opens.append(opens[index])
+            result.highs.append(max(highs[index:end]))
+            result.lows.append(min(lows[index:end]))
+            result.closes.append(closes[end - 1])
+            result.volumes.append(sum(volumes[index:end]))
+            index = end
+        return result
+
+    def patch(self, rows: List[List[float]], limit: int) -> "CandleSeries":
+        # вставка баров в середину истории (бэкфилл дыр); совпавшие ts заменяются
+        if not rows:
+            return self
+        by_ts = {int(row[0]): row for row in self.rows()}
+        for row in rows:
+            by_ts[int(row[0])] = row
+        return CandleSeries.empty().merge([by_ts[ts] for ts in sorted(by_ts)], limit)
+
+    def rows(self) -> List[List[float]]:
+        return [list(row) for row in zip(*self.columns())]
+
+    def to_flat(self) -> array:
+        values = array("d", bytes(8 * 6 * len(self)))
+        for index, column in enumerate(self.columns()):
+            values[index::6] = array("d", column)
+        return values
+
+
+@dataclass
+class OhlcvEntry:
+    # запись _OHLCV_CACHE: ts — когда ряд обновлялся, limit — под какую длину истории,
+    # persisted_ts — последний бар, записанный на диск
+    ts: float
+    limit: int
+    series: CandleSeries
+    persisted_ts: Optional[int] = None
+
+
 def fetch_ohlcv_cached(
     exchange: ccxt.bybit,
     symbol: str,
     timeframe: str,
     limit: int,
-    ttl_seconds: int,
-) -> Optional[Tuple[List[float], List[float], List[float], List[float], List[float]]]:
+    ttl_seconds: Optional[int],
+) -> Optional[CandleSeries]:
+    if OHLCV_RESAMPLE_ENABLED and _resample_base_limit(timeframe, limit):
+        resampled = _fetch_resampled_ohlcv(exchange, symbol, timeframe, limit)
+        if resampled is not None:
+            return resampled
     now = time.time()
     cache_key = (symbol, timeframe)
+    # одна общая история на (symbol, timeframe) размером с самое большое окно,
+    # каждый вызывающий получает свой хвост нужной длины
+    history_limit = max(limit, OHLCV_HISTORY_LIMIT, _OHLCV_HISTORY_LIMITS.get(cache_key, 0))
+    _OHLCV_HISTORY_LIMITS[cache_key] = history_limit
     cached = _OHLCV_CACHE.get(cache_key)
-    if cached and now - float(cached["ts"]) < ttl_seconds:
-        return cached["parsed"]  # type: ignore[return-value]
+    if cached and cached.limit >= limit and _ohlcv_is_fresh(cached, timeframe, ttl_seconds, now):
+        return cached.series.window(limit)
     try:
-        ohlcv = exchange.fetch_ohlcv(symbol, timeframe=timeframe, limit=limit)
+        for _ in range(2):
+            series = _single_flight(
+                ("ohlcv", symbol, timeframe),
+                lambda: _refresh_ohlcv_entry(exchange, symbol, timeframe, history_limit),
+            )
+            # ведомый мог дождаться чужого запроса с более короткой историей — тогда догружаем свою
+            entry = _OHLCV_CACHE.get(cache_key)
+            if not series or not entry or entry.limit >= history_limit:
+                break
     except Exception as e:
         if _is_rate_limit_error(e):
             _log_rate_limit_once(f"fetch_ohlcv {symbol} {timeframe}")
+            _RATE_GOVERNOR.mark_rate_limited(symbol)
             return None
         print(f"[DATA] fetch_ohlcv error {symbol} {timeframe}: {e}")
         return None
-    if not ohlcv:
+    if not series:
         return None
-    highs = [row[2] for row in ohlcv]
-    lows = [row[3] for row in ohlcv]
-    closes = [row[4] for row in ohlcv]
-    volumes = [row[5] for row in ohlcv]
-    timestamps = [row[0] for row in ohlcv]
-    parsed = (highs, lows, closes, volumes, timestamps)
-    _OHLCV_CACHE[cache_key] = {
-        "ts": now,
-        "ohlcv": ohlcv,
-        "parsed": parsed,
-    }
-    return parsed
+    return series.window(limit)
 
 
-def _parsed_to_dict(
-    parsed: Tuple[List[float], List[float], List[float], List[float], List[float]],
-) -> Dict[str, List[float]]:
-    highs, lows, closes, volumes, timestamps = parsed
-    return {
-        "highs": highs,
-        "lows": lows,
-        "closes": closes,
-        "volumes": volumes,
-        "timestamps": timestamps,
-    }
+def _resample_base_limit(timeframe: str, limit: int) -> Optional[int]:
+    # сколько баров BASE_TIMEFRAME нужно, чтобы собрать limit баров timeframe
+    base_seconds = timeframe_to_seconds(BASE_TIMEFRAME)
+    target_seconds = timeframe_to_seconds(timeframe)
+    if not base_seconds or target_seconds <= base_seconds or target_seconds % base_seconds:
+        return None
+    factor = target_seconds // base_seconds
+    return limit * factor + factor - 1
+
+
+def _fetch_resampled_ohlcv(
+    exchange: ccxt.bybit,
+    symbol: str,
+    timeframe: str,
+    limit: int,
+) -> Optional[CandleSeries]:
+    base_limit = _resample_base_limit(timeframe, limit)
+    if not base_limit:
+        return None
+    if not fetch_ohlcv_cached(exchange, symbol, BASE_TIMEFRAME, base_limit, OHLCV_FORMING_BAR_TTL_SECONDS):
+        return None
+    base_series = _OHLCV_CACHE[(symbol, BASE_TIMEFRAME)].series
+    cache_key = (symbol, timeframe)
+    cached = _RESAMPLED_CACHE.get(cache_key)
+    if cached and cached[0] is base_series:
+        series = cached[1]
+    else:
+        series = base_series.resample(
+            timeframe_to_seconds(timeframe) * 1000,
+            timeframe_to_seconds(BASE_TIMEFRAME) * 1000,
+        )
+        _RESAMPLED_CACHE[cache_key] = (base_series, series)
+    if len(series) < limit:
+        # окно должно быть той же длины, что и при прямой загрузке старшего ТФ; короче оно и
+        # после дыры в базовом ряду — тогда старший ТФ грузится напрямую
+        return None
+    return series.window(limit)
+
+
+def _ohlcv_is_fresh(
+    cached: "OhlcvEntry",
+    timeframe: str,
+    ttl_seconds: Optional[int],
+    now: float,
+) -> bool:
+    # ttl_seconds — допустимый возраст формирующегося бара; None = нужны только закрытые бары
+    age = now - cached.ts
+    if age < OHLCV_MIN_REFRESH_SECONDS:
+        return True
+    series = cached.series
+    timeframe_seconds = timeframe_to_seconds(timeframe)
+    if timeframe_seconds and series:
+        next_bar_open = series.timestamps[-1] / 1000 + timeframe_seconds
+        if now >= next_bar_open:
+            return False
+        if ttl_seconds is None:
+            return True
+    return ttl_seconds is not None and age < ttl_seconds
+
+
+def _refresh_ohlcv_entry(
+    exchange: ccxt.bybit,
+    symbol: str,
+    timeframe: str,
+    history_limit: int,
+) -> Optional[CandleSeries]:
+    now = time.time()
+    cache_key = (symbol, timeframe)
+    cached = _OHLCV_CACHE.get(cache_key)
+    if cached is None and OHLCV_DISK_CACHE_ENABLED:
+        # после рестарта берём историю с диска и только докачиваем хвост
+        disk_series = _load_ohlcv_from_disk(symbol, timeframe)
+        if disk_series:
+            cached = OhlcvEntry(0.0, len(disk_series), disk_series, disk_series.timestamps[-1])
+    series = _fetch_ohlcv_series(exchange, symbol, timeframe, history_limit, cached)
+    if not series:
+        return None
+    persisted_ts = cached.persisted_ts if cached else None
+    if OHLCV_DISK_CACHE_ENABLED and series.timestamps[-1] != persisted_ts:
+        if _save_ohlcv_to_disk(symbol, timeframe, series):
+            persisted_ts = series.timestamps[-1]
+    _OHLCV_CACHE[cache_key] = OhlcvEntry(now, history_limit, series, persisted_ts)
+    return series
+
+
+def _ohlcv_disk_symbol(symbol: str) -> str:
+    return re.sub(r"[^A-Za-z0-9]+", "_", symbol).strip("_")
+
+
+def _ohlcv_disk_path(symbol: str, timeframe: str) -> str:
+    return os.path.join(OHLCV_DISK_CACHE_DIR, f"{_ohlcv_disk_symbol(symbol)}_{timeframe}.bin")
+
+
+def load_ohlcv_disk_cache(symbols: List[str]) -> int:
+    # прогрев базового ТФ при старте; 0 — на диске ничего нет и первый цикл качал бы всё с нуля
+    loaded = 0
+    for symbol in symbols:
+        if (symbol, BASE_TIMEFRAME) in _OHLCV_CACHE:
+            continue
+        series = _load_ohlcv_from_disk(symbol, BASE_TIMEFRAME)
+        if series:
+            _OHLCV_CACHE[(symbol, BASE_TIMEFRAME)] = OhlcvEntry(0.0, len(series), series, series.timestamps[-1])
+            loaded += 1
+    return loaded
+
+
+def prune_ohlcv_disk_cache(keep: set) -> None:
+    # файлы символов, выбывших из вселенной; имя файла — "<символ>_<таймфрейм>.bin"
+    try:
+        names = os.listdir(OHLCV_DISK_CACHE_DIR)
+    except OSError:
+        return
+    kept = {_ohlcv_disk_symbol(symbol) for symbol in keep}
+    for name in names:
+        if not name.endswith(".bin") or name[:-len(".bin")].rsplit("_", 1)[0] in kept:
+            continue
+        try:
+            os.remove(os.path.join(OHLCV_DISK_CACHE_DIR, name))
+        except OSError as e:
+            print(f"[DATA] ohlcv disk cache remove error {name}: {e}")
+
+
+def _load_ohlcv_from_disk(symbol: str, timeframe: str) -> Optional[CandleSeries]:
+    path = _ohlcv_disk_path(symbol, timeframe)
+    if not os.path.exists(path):
+        return None
+    values = array("d")
+    try:
+        with open(path, "rb") as file:
+            values.frombytes(file.read())
+    except Exception as e:
+        print(f"[DATA] ohlcv disk cache read error {symbol} {timeframe}: {e}")
+        return None
+    if not values or len(values) % 6:
+        return None
+    return CandleSeries.from_flat(values)
+
+
+def _save_ohlcv_to_disk(symbol: str, timeframe: str, series: CandleSeries) -> bool:
+    values = series.to_flat()
+    try:
+        os.makedirs(OHLCV_DISK_CACHE_DIR, exist_ok=True)
+        with tempfile.NamedTemporaryFile("wb", delete=False, dir=OHLCV_DISK_CACHE_DIR) as tmp:
+            values.tofile(tmp)
+            tmp_path = tmp.name
+        os.replace(tmp_path, _ohlcv_disk_path(symbol, timeframe))
+        return True
+    except Exception as e:
+        print(f"[DATA] ohlcv disk cache write error {symbol} {timeframe}: {e}")
+        return False
+
+
+def _fetch_ohlcv_series(
+    exchange: ccxt.bybit,
+    symbol: str,
+    timeframe: str,
+    limit: int,
+    cached: Optional["OhlcvEntry"],
+) -> Optional[CandleSeries]:
+    timeframe_ms = timeframe_to_seconds(timeframe) * 1000
+    if OHLCV_INCREMENTAL_ENABLED and cached and cached.series and timeframe_ms:
+        cached_series = cached.series
+        last_ts = cached_series.timestamps[-1]
+        missing_bars = int((time.time() * 1000 - last_ts) // timeframe_ms) + 1
+        if missing_bars <= OHLCV_INCREMENTAL_MAX_BARS:
+            new_rows = _call_exchange(
+                "ohlcv",
+                f"fetch_ohlcv {symbol} {timeframe}",
+                lambda: exchange.fetch_ohlcv(
+                    symbol,
+                    timeframe=timeframe,
+                    since=int(last_ts),
+                    limit=missing_bars + 1,
+                ),
+                exchange,
+            )
+            series = cached_series.merge(new_rows or [], limit)
+            short_bars = limit - len(series)
+            if cached.limit < limit and short_bars > 0:
+                # символу понадобилась история длиннее (например, под старший ТФ) —
+                # докачиваем только недостающее начало
+                first_ts = series.timestamps[0]
+                head = _fetch_ohlcv_pages(exchange, symbol, timeframe, first_ts - short_bars * timeframe_ms, short_bars)
+                series = series.patch([row for row in head if row[0] < first_ts], limit)
+            return series
+    if limit <= OHLCV_FETCH_MAX_BARS or not timeframe_ms:
+        rows = _call_exchange(
+            "ohlcv",
+            f"fetch_ohlcv {symbol} {timeframe}",
+            lambda: exchange.fetch_ohlcv(symbol, timeframe=timeframe, limit=min(limit, OHLCV_FETCH_MAX_BARS)),
+            exchange,
+        )
+    else:
+        now_ms = int(time.time() * 1000)
+        rows = _fetch_ohlcv_pages(
+            exchange,
+            symbol,
+            timeframe,
+            now_ms - now_ms % timeframe_ms - (limit - 1) * timeframe_ms,
+            limit,
+        )
+    if not rows:
+        return None
+    return CandleSeries.from_rows(rows[-limit:])
+
+
+def _fetch_ohlcv_pages(
+    exchange: ccxt.bybit,
+    symbol: str,
+    timeframe: str,
+    since: int,
+    bars: int,
+) -> List[List[float]]:
+    # больше OHLCV_FETCH_MAX_BARS за запрос биржа не отдаёт — идём страницами по since=
+    timeframe_ms = timeframe_to_seconds(timeframe) * 1000
+    rows: List[List[float]] = []
+    while len(rows) < bars:
+        page_limit = min(bars - len(rows), OHLCV_FETCH_MAX_BARS)
+        page = _call_exchange(
+            "ohlcv",
+            f"fetch_ohlcv {symbol} {timeframe}",
+            lambda: exchange.fetch_ohlcv(symbol, timeframe=timeframe, since=int(since), limit=page_limit),
+            exchange,
+        )
+        page = [row for row in page or [] if row[0] >= since]
+        if not page:
+            break
+        rows.extend(page)
+        since = int(page[-1][0]) + timeframe_ms
+        if len(page) < page_limit:
+            break
+    return rows
+
+
+def find_ohlcv_gaps(
+    timestamps: Sequence[int],
+    timeframe_ms: int,
+    now_ms: Optional[int] = None,
+) -> List[Tuple[int, int]]:
+    # диапазоны пропущенных баров (включительно); с now_ms — ещё и недостающий хвост
+    gaps = []
+    for prev, current in zip(timestamps, timestamps[1:]):
+        if current - prev > timeframe_ms:
+            gaps.append((prev + timeframe_ms, current - timeframe_ms))
+    if now_ms is not None and timestamps:
+        current_open = now_ms - now_ms % timeframe_ms
+        if current_open > timestamps[-1]:
+            gaps.append((timestamps[-1] + timeframe_ms, current_open))
+    return gaps
+
+
+def repair_ohlcv_gaps(exchange: ccxt.bybit, symbol: str, timeframe: str) -> Optional[CandleSeries]:
+    cache_key = (symbol, timeframe)
+    cached = _OHLCV_CACHE.get(cache_key)
+    timeframe_ms = timeframe_to_seconds(timeframe) * 1000
+    if not cached or not cached.series or not timeframe_ms:
+        return None
+    stats = _OHLCV_GAP_STATS.setdefault(
+        symbol,
+        {"repaired": 0, "unrecoverable": 0, "last_attempt_ts": 0.0},
+    )
+    now = time.time()
+    # повторные неудачи дешёвые: не чаще раза в cooldown и без уже известных дыр
+    if now - float(stats["last_attempt_ts"]) < OHLCV_GAP_REPAIR_COOLDOWN_SECONDS:
+        return None
+    stats["last_attempt_ts"] = now
+    series = cached.series
+    known_bad = _OHLCV_UNRECOVERABLE_GAPS.setdefault(cache_key, set())
+    gaps = [
+        gap for gap in find_ohlcv_gaps(series.timestamps, timeframe_ms, int(now * 1000))
+        if gap not in known_bad
+    ][-OHLCV_GAP_REPAIR_MAX_RANGES:]
+    if not gaps:
+        return None
+    rows = []
+    for start, end in gaps:
+        bars = int((end - start) // timeframe_ms) + 1
+        try:
+            fetched = _call_exchange(
+                "ohlcv",
+                f"backfill {symbol} {timeframe}",
+                lambda: exchange.fetch_ohlcv(
+                    symbol,
+                    timeframe=timeframe,
+                    since=int(start),
+                    limit=min(bars, OHLCV_FETCH_MAX_BARS),
+                ),
+                exchange,
+            )
+        except Exception as e:
+            if _is_rate_limit_error(e):
+                _RATE_GOVERNOR.mark_rate_limited(symbol)
+                return None
+            print(f"[DATA] backfill error {symbol} {timeframe}: {e}")
+            continue
+        rows.extend(row for row in fetched or [] if start <= row[0] <= end)
+    history_limit = cached.limit
+    repaired = series.patch(rows, max(history_limit, len(series)))
+    remaining = find_ohlcv_gaps(repaired.timestamps, timeframe_ms, int(now * 1000))
+    for start, end in gaps:
+        left = [gap for gap in remaining if gap[0] <= end and gap[1] >= start]
+        if not left:
+            stats["repaired"] += 1
+            continue
+        stats["unrecoverable"] += 1
+        if end < repaired.timestamps[-1]:
+            # биржа не отдала бары внутри истории — больше их не запрашиваем
+            known_bad.update(left)
+    if repaired is series:
+        return None
+    cached.series = repaired
+    reset_series_state(symbol, timeframe)
+    if OHLCV_DISK_CACHE_ENABLED and _save_ohlcv_to_disk(symbol, timeframe, repaired):
+        cached.persisted_ts = repaired.timestamps[-1]
+    return repaired
+
+
+def get_gap_stats() -> Dict[str, float]:
+    totals = {"repaired": 0, "unrecoverable": 0}
+    for values in _OHLCV_GAP_STATS.values():
+        for name in totals:
+            totals[name] += values[name]
+    return totals
+
+
+def prefetch_ohlcv(
+    exchange: ccxt.bybit,
+    symbols: List[str],
+    windows: List[Tuple[str, int, Optional[int]]],
+) -> None:
+    # (timeframe, limit, ttl_seconds); результаты ложатся в _OHLCV_CACHE,
+    # отметки rate limit прошлых циклов снимаются — prefetch выставит актуальные
+    _RATE_GOVERNOR.clear_rate_limited(symbols)
+    try:
+        ensure_markets_loaded(exchange)
+    except Exception as e:
+        print(f"[DATA] load_markets error: {e}")
+    jobs = [(symbol, timeframe, limit, ttl) for symbol in symbols for timeframe, limit, ttl in windows]
+    if not jobs:
+        return
+    with ThreadPoolExecutor(max_workers=ENGINE_PREFETCH_WORKERS) as ex:
+        futures = [
+            ex.submit(fetch_ohlcv_cached, exchange, symbol, timeframe, limit, ttl)
+            for symbol, timeframe, limit, ttl in jobs
+        ]
+        for fut in as_completed(futures):
+            try:
+                fut.result()
+            except Exception as e:
+                print(f"[DATA] prefetch error: {e}")
+
+
+def fetch_cycle_ohlcv(exchange: ccxt.bybit, symbol: str) -> Optional[CandleSeries]:
+    # базовое окно цикла движка; символ, упёршийся в rate limit на prefetch, до
+    # отложенного прохода не перезапрашиваем
+    if _RATE_GOVERNOR.is_rate_limited(symbol):
+        return None
+    return fetch_ohlcv_cached(exchange, symbol, BASE_TIMEFRAME, limit=300, ttl_seconds=OHLCV_FORMING_BAR_TTL_SECONDS)
 
 
 def fetch_ohlcv_raw_cached(
@@ -2422,15 +3703,12 @@ def fetch_ohlcv_raw_cached(
     symbol: str,
     timeframe: str,
     limit: int,
-    ttl_seconds: int,
+    ttl_seconds: Optional[int],
 ) -> Optional[List[List[float]]]:
-    parsed = fetch_ohlcv_cached(exchange, symbol, timeframe, limit, ttl_seconds)
-    if parsed is None:
-        return None
-    cached = _OHLCV_CACHE.get((symbol, timeframe))
-    if not cached:
+    series = fetch_ohlcv_cached(exchange, symbol, timeframe, limit, ttl_seconds)
+    if series is None:
         return None
-    return cached.get("ohlcv")  # type: ignore[return-value]
+    return series.rows()
 
 
 def timeframe_to_seconds(timeframe: str) -> int:
@@ -2458,13 +3736,25 @@ def _median(values: List[float]) -> float:
     return values_sorted[mid]
 
 
-def _has_anomalies(base_data: Dict[str, List[float]]) -> bool:
+def _has_anomalies(base_data: CandleSeries, windows: Optional[Dict] = None) -> bool:
+    # windows — состояние rolling_windows: уже проверенные бары не перепроверяются,
+    # валидируется только текущий бар, остальное — готовые медиана/максимумы окна
     highs = base_data.get("highs", [])
     lows = base_data.get("lows", [])
     closes = base_data.get("closes", [])
     if not highs or not lows or not closes:
         return True
-    if any(value <= 0 for value in highs + lows + closes):
+    if windows is not None:
+        invalid_age = windows["invalid_age"]
+        if not windows["current_valid"] or (invalid_age is not None and invalid_age < len(closes)):
+            return True
+        median_range = windows["range_median"]
+        if median_range <= 0:
+            return True
+        if windows["range_max"] > median_range * ENGINE_V3_ANOMALY_RANGE_MULT:
+            return True
+        return windows["max_gap"] > ENGINE_V3_MAX_GAP_PCT
+    if min(highs) <= 0 or min(lows) <= 0 or min(closes) <= 0:
         return True
     ranges = []
     for high, low, close in zip(highs, lows, closes):
@@ -2486,7 +3776,7 @@ def _has_anomalies(base_data: Dict[str, List[float]]) -> bool:
     return False
 
 
-def data_integrity_gate(symbol: str, base_data: Dict[str, List[float]], timeframe_seconds: int) -> Tuple[bool, str]:
+def data_integrity_gate(symbol: str, base_data: CandleSeries, timeframe_seconds: int) -> Tuple[bool, str]:
     closes = base_data.get("closes", [])
     timestamps = base_data.get("timestamps", [])
     if len(closes) < ENGINE_V3_MIN_CANDLES:
@@ -2496,11 +3786,30 @@ def data_integrity_gate(symbol: str, base_data: Dict[str, List[float]], timefram
     last_ts = timestamps[-1] / 1000
     if timeframe_seconds and (time.time() - last_ts) > timeframe_seconds * ENGINE_V3_DATA_STALE_MULTIPLIER:
         return False, "stale_data"
-    if _has_anomalies(base_data):
+    if _has_anomalies(base_data, rolling_windows(symbol, BASE_TIMEFRAME, base_data, integrity_only=True)):
         return False, "anomalous_candles"
     return True, "ok"
 
 
+def repair_and_check_integrity(
+    exchange: ccxt.bybit,
+    symbol: str,
+    base_data: CandleSeries,
+    timeframe_seconds: int,
+    limit: int = 300,
+) -> Tuple[CandleSeries, bool, str]:
+    # при stale_data/anomalous_candles сначала пробуем точечно докачать дыры
+    ok, reason = data_integrity_gate(symbol, base_data, timeframe_seconds)
+    if ok or not OHLCV_GAP_REPAIR_ENABLED or reason not in {"stale_data", "anomalous_candles"}:
+        return base_data, ok, reason
+    repaired = repair_ohlcv_gaps(exchange, symbol, BASE_TIMEFRAME)
+    if repaired is None:
+        return base_data, ok, reason
+    base_data = repaired.window(limit)
+    ok, reason = data_integrity_gate(symbol, base_data, timeframe_seconds)
+    return base_data, ok, reason
+
+
 def get_live_price_if_needed(
     exchange: ccxt.bybit,
     symbol: str,
@@ -2512,7 +3821,7 @@ def get_live_price_if_needed(
     if not has_active_setup:
         return fallback_price
     try:
-        ticker = exchange.fetch_ticker(symbol)
+        ticker = fetch_ticker_snapshot(exchange, symbol)
         last_price = ticker.get("last") or ticker.get("close")
         if last_price is None:
             return fallback_price
@@ -2520,36 +3829,93 @@ def get_live_price_if_needed(
     except Exception as e:
         if _is_rate_limit_error(e):
             _log_rate_limit_once(f"fetch_ticker {symbol}")
+            _RATE_GOVERNOR.mark_rate_limited(symbol)
             return None
         return fallback_price
 
 
 # ================== ANALYSIS ENGINE V2 ==================
-def _safe_slope(series: List[float], length: int = 5) -> float:
+def _safe_slope(series: Sequence[float], length: int = 5) -> float:
     if len(series) <= length:
         return 0.0
     return (series[-1] - series[-length]) / max(length, 1)
 
 
-def _sma(values: List[float], period: int) -> Optional[float]:
+def _sma(values: Sequence[float], period: int) -> Optional[float]:
     if len(values) < period:
         return None
     return sum(values[-period:]) / period
 
 
-def _std(values: List[float], period: int) -> Optional[float]:
+def _std(values: Sequence[float], period: int, mean: Optional[float] = None) -> Optional[float]:
     if len(values) < period:
         return None
-    mean = sum(values[-period:]) / period
+    if mean is None:
+        mean = sum(values[-period:]) / period
     variance = sum((v - mean) ** 2 for v in values[-period:]) / period
     return math.sqrt(variance)
 
 
-def trend_features(highs: List[float], lows: List[float], closes: List[float]) -> Dict:
+class FeatureGraph:
+    # граф промежуточных величин одного окна свечей: каждая вершина объявлена один раз,
+    # считается лениво при первом обращении и дальше берётся из memo всеми потребителями
+    # (TR — и для ATR, и для ADX; SMA20 — и для полос Боллинджера; свинги — для риска)
+    SWING_BARS = 20
+    LEVEL_BARS = 20
+    COMPRESSION_BARS = 8
+
+    def __init__(self, base_data: CandleSeries, precomputed: Optional[Dict] = None):
+        self.highs = base_data["highs"]
+        self.lows = base_data["lows"]
+        self.closes = base_data["closes"]
+        self.volumes = base_data["volumes"]
+        # precomputed — готовые значения вершин (batch/stream), их не пересчитываем
+        self._memo: Dict[str, object] = dict(precomputed or {})
+        self._nodes = {
+            "true_range": lambda: true_ranges(self.highs, self.lows, self.closes),
+            "directional_movement": lambda: directional_movement(self.highs, self.lows),
+            "atr": self._atr,
+            "adx": self._adx,
+            "ema_fast_series": lambda: ema(self.closes, 50),
+            "ema_slow_series": lambda: ema(self.closes, 200),
+            "rsi_series": lambda: rsi(self.closes, 14),
+            "close_sma20": lambda: _sma(self.closes, 20),
+            "close_std20": lambda: _std(self.closes, 20, mean=self["close_sma20"]),
+            "volume_sma20": lambda: _sma(self.volumes, 20),
+            "swing_low": lambda: min(self.lows[-self.SWING_BARS:]),
+            "swing_high": lambda: max(self.highs[-self.SWING_BARS:]),
+            "high_n_prev": lambda: max(self.highs[-self.LEVEL_BARS - 1:-1]),
+            "low_n_prev": lambda: min(self.lows[-self.LEVEL_BARS - 1:-1]),
+            "recent_range": lambda: (
+                max(self.highs[-self.COMPRESSION_BARS:]) - min(self.lows[-self.COMPRESSION_BARS:])
+            ),
+            "retest_low": lambda: min(self.lows[-TRIGGER_RETEST_MAX_BARS:]),
+            "retest_high": lambda: max(self.highs[-TRIGGER_RETEST_MAX_BARS:]),
+        }
+
+    def _atr(self) -> Optional[float]:
+        if len(self.closes) < 15:
+            return None
+        return atr_from_true_range(self["true_range"], 14)
+
+    def _adx(self) -> Optional[float]:
+        if len(self.closes) < 29:
+            return None
+        plus_dm, minus_dm = self["directional_movement"]
+        return adx_from_components(self["true_range"], plus_dm, minus_dm, 14)
+
+    def __getitem__(self, name: str):
+        if name not in self._memo:
+            self._memo[name] = self._nodes[name]()
+        return self._memo[name]
+
+
+def trend_features(graph: FeatureGraph) -> Dict:
+    highs, lows, closes = graph.highs, graph.lows, graph.closes
     if len(closes) < 200:
         return {}
-    ema_fast_series = ema(closes, 50)
-    ema_slow_series = ema(closes, 200)
+    ema_fast_series = graph["ema_fast_series"]
+    ema_slow_series = graph["ema_slow_series"]
     ema_fast_val = ema_fast_series[-1]
     ema_slow_val = ema_slow_series[-1]
     slope_fast = _safe_slope(ema_fast_series, 5)
@@ -2575,10 +3941,11 @@ def trend_features(highs: List[float], lows: List[float], closes: List[float]) -
     }
 
 
-def momentum_features(closes: List[float]) -> Dict:
+def momentum_features(graph: FeatureGraph) -> Dict:
+    closes = graph.closes
     if len(closes) < 20:
         return {}
-    rsi_series = rsi(closes, 14)
+    rsi_series = graph["rsi_series"]
     rsi_val = rsi_series[-1]
     rsi_slope = _safe_slope(rsi_series, 5)
     roc = ((closes[-1] - closes[-6]) / closes[-6]) * 100 if len(closes) > 6 else 0.0
@@ -2589,14 +3956,14 @@ def momentum_features(closes: List[float]) -> Dict:
     }
 
 
-def volatility_features(highs: List[float], lows: List[float], closes: List[float]) -> Dict:
-    atr_val = atr(highs, lows, closes, 14)
+def volatility_features(graph: FeatureGraph) -> Dict:
+    atr_val = graph["atr"]
     if atr_val is None:
         return {}
-    price = closes[-1]
+    price = graph.closes[-1]
     atr_pct = (atr_val / price) * 100 if price else 0.0
-    bb_sma = _sma(closes, 20)
-    bb_std = _std(closes, 20)
+    bb_sma = graph["close_sma20"]
+    bb_std = graph["close_std20"]
     bb_width = 0.0
     if bb_sma is not None and bb_std is not None and bb_sma != 0:
         upper = bb_sma + (2 * bb_std)
@@ -2609,8 +3976,9 @@ def volatility_features(highs: List[float], lows: List[float], closes: List[floa
     }
 
 
-def volume_features(volumes: List[float]) -> Dict:
-    vol_sma20 = _sma(volumes, 20)
+def volume_features(graph: FeatureGraph) -> Dict:
+    volumes = graph.volumes
+    vol_sma20 = graph["volume_sma20"]
     if vol_sma20 is None or vol_sma20 <= 0:
         return {}
     vol_ratio = volumes[-1] / vol_sma20
@@ -2622,19 +3990,18 @@ def volume_features(volumes: List[float]) -> Dict:
     }
 
 
-def level_features(highs: List[float], lows: List[float], closes: List[float]) -> Dict:
-    n = 20
+def level_features(graph: FeatureGraph) -> Dict:
+    highs, lows, closes = graph.highs, graph.lows, graph.closes
+    n = graph.LEVEL_BARS
     if len(highs) < n + 1 or len(lows) < n + 1:
         return {}
-    high_n_prev = max(highs[-n - 1:-1])
-    low_n_prev = min(lows[-n - 1:-1])
-    compression_window = 8
-    if len(highs) < compression_window or len(lows) < compression_window:
+    high_n_prev = graph["high_n_prev"]
+    low_n_prev = graph["low_n_prev"]
+    if len(highs) < graph.COMPRESSION_BARS or len(lows) < graph.COMPRESSION_BARS:
         compression = 0.0
     else:
-        recent_range = max(highs[-compression_window:]) - min(lows[-compression_window:])
-        atr_val = atr(highs, lows, closes, 14) or 0.0
-        compression = (recent_range / atr_val) if atr_val else 0.0
+        atr_val = graph["atr"] or 0.0
+        compression = (graph["recent_range"] / atr_val) if atr_val else 0.0
 
     price = closes[-1]
     dist_to_high = ((high_n_prev - price) / price) * 100 if price else 0.0
@@ -2648,23 +4015,233 @@ def level_features(highs: List[float], lows: List[float], closes: List[float]) -
     }
 
 
-def build_features(base_data: Dict[str, List[float]]) -> Dict:
-    highs = base_data["highs"]
-    lows = base_data["lows"]
-    closes = base_data["closes"]
-    volumes = base_data["volumes"]
+def build_features(base_data: CandleSeries, precomputed: Optional[Dict] = None) -> Dict:
+    # precomputed — готовые ряды/значения индикаторов из build_features_batch или стрима
+    graph = FeatureGraph(base_data, precomputed)
     features = {}
-    features.update(trend_features(highs, lows, closes))
-    features.update(momentum_features(closes))
-    features.update(volatility_features(highs, lows, closes))
-    features.update(volume_features(volumes))
-    features.update(level_features(highs, lows, closes))
-    adx_val = adx(highs, lows, closes, 14)
+    features.update(trend_features(graph))
+    features.update(momentum_features(graph))
+    features.update(volatility_features(graph))
+    features.update(volume_features(graph))
+    features.update(level_features(graph))
+    adx_val = graph["adx"]
     if adx_val is not None:
         features["adx"] = adx_val
+    if len(graph.lows) and len(graph.highs):
+        # свинги за 20 баров нужны стопам (check_trigger) и evaluate_risk — считаем здесь один раз
+        features["swing_low"] = graph["swing_low"]
+        features["swing_high"] = graph["swing_high"]
+    if len(graph.lows) >= TRIGGER_RETEST_MAX_BARS and len(graph.highs) >= TRIGGER_RETEST_MAX_BARS:
+        features["retest_low"] = graph["retest_low"]
+        features["retest_high"] = graph["retest_high"]
+    return features
+
+
+def _swing_levels(base_data: CandleSeries, features: Optional[Dict] = None) -> Tuple[float, float]:
+    if features and "swing_low" in features and "swing_high" in features:
+        return features["swing_low"], features["swing_high"]
+    lows = base_data["lows"]
+    highs = base_data["highs"]
+    swing_low = min(lows[-20:]) if len(lows) >= 20 else min(lows)
+    swing_high = max(highs[-20:]) if len(highs) >= 20 else max(highs)
+    return swing_low, swing_high
+
+
+def reset_series_state(symbol: str, timeframe: str) -> None:
+    with _INDICATOR_STREAMS_LOCK:
+        _BAR_WINDOWS.pop((symbol, timeframe), None)
+        _FEATURE_CACHE.pop((symbol, timeframe), None)
+
+
+def rolling_windows(symbol: str, timeframe: str, base_data: CandleSeries, integrity_only: bool = False) -> Optional[Dict]:
+    # окна докатываются по барам кэша; последний бар окна не фиксируется, а подмешивается;
+    # integrity_only — только то, что нужно _has_anomalies
+    if not ROLLING_WINDOWS_ENABLED or not base_data or len(base_data) < ENGINE_V3_MIN_CANDLES:
+        return None
+    cached = _OHLCV_CACHE.get((symbol, timeframe))
+    series = cached.series if cached else None
+    if not series or series.timestamps[-1] != base_data.timestamps[-1]:
+        return None
+    timestamps = series.timestamps
+    highs, lows = series.highs, series.lows
+    closes, volumes = series.closes, series.volumes
+    committed_end = len(timestamps) - 1
+    key = (symbol, timeframe)
+    with _INDICATOR_STREAMS_LOCK:
+        windows = _BAR_WINDOWS.get(key)
+        start = 0
+        if windows is not None:
+            position = bisect_left(timestamps, windows.last_ts) if windows.last_ts is not None else len(timestamps)
+            if (
+                position < committed_end
+                and timestamps[position] == windows.last_ts
+                and windows.last_bar == (highs[position], lows[position], closes[position], volumes[position])
+            ):
+                start = position + 1
+            else:
+                # история переписана (бэкфилл, перезагрузка) — пересобираем с начала
+                windows = None
+        if windows is None:
+            windows = BarWindows(
+                level_bars=FeatureGraph.LEVEL_BARS,
+                swing_bars=FeatureGraph.SWING_BARS,
+                retest_bars=TRIGGER_RETEST_MAX_BARS,
+                compression_bars=FeatureGraph.COMPRESSION_BARS,
+                anomaly_bars=ENGINE_V3_MIN_CANDLES,
+            )
+            _BAR_WINDOWS[key] = windows
+        for index in range(start, committed_end):
+            windows.update(timestamps[index], highs[index], lows[index], closes[index], volumes[index])
+        if not windows.ready():
+            return None
+        if integrity_only:
+            return windows.integrity(highs[-1], lows[-1], closes[-1])
+        return windows.snapshot(highs[-1], lows[-1], closes[-1], volumes[-1])
+
+
+def _window_indicators(entry: Dict, base_data: CandleSeries) -> Dict:
+    # состояние индикаторов по закрытым барам окна (все, кроме последнего) строится
+    # один раз на закрытый бар; живой бар подмешивается без фиксации
+    stream = entry.get("stream")
+    if stream is None:
+        stream = IndicatorStream()
+        timestamps = base_data.timestamps
+        highs, lows, closes = base_data["highs"], base_data["lows"], base_data["closes"]
+        for index in range(len(timestamps) - 1):
+            stream.update(timestamps[index], highs[index], lows[index], closes[index])
+        entry["stream"] = stream
+    return stream.snapshot((base_data["highs"][-1], base_data["lows"][-1], base_data["closes"][-1]))
+
+
+def _feature_memo_keys(base_data: CandleSeries) -> Tuple[tuple, tuple]:
+    # закрытая часть окна: первый и последний закрытый бар + длина (перезапись истории
+    # сбрасывает запись через reset_series_state); живой бар — целиком
+    timestamps = base_data.timestamps
+    closed_key = (timestamps[0], timestamps[-2] if len(timestamps) > 1 else None, len(timestamps))
+    live_bar = tuple(base_data[name][-1] for name in CandleSeries.COLUMNS)
+    return closed_key, live_bar
+
+
+def feature_memo_status(symbol: str, base_data: CandleSeries, timeframe: str = BASE_TIMEFRAME) -> str:
+    # hit — признаки готовы, live — изменился только живой бар (O(1) шаг по состоянию
+    # закрытых баров), full — закрытые бары другие, нужен полный пересчёт окна
+    if not FEATURE_CACHE_ENABLED or not base_data:
+        return "full"
+    closed_key, live_bar = _feature_memo_keys(base_data)
+    with _INDICATOR_STREAMS_LOCK:
+        cached = _FEATURE_CACHE.get((symbol, timeframe))
+    if not cached or cached["closed_key"] != closed_key:
+        return "full"
+    return "hit" if cached["live_bar"] == live_bar else "live"
+
+
+def build_symbol_features(
+    symbol: str,
+    base_data: CandleSeries,
+    timeframe: str = BASE_TIMEFRAME,
+    computed: Optional[Dict] = None,
+) -> Dict:
+    # computed — признаки этого окна, уже посчитанные batch-ем; используются при полном промахе
+    entry: Dict = {}
+    live_bar = None
+    if FEATURE_CACHE_ENABLED and base_data:
+        closed_key, live_bar = _feature_memo_keys(base_data)
+        with _INDICATOR_STREAMS_LOCK:
+            cached = _FEATURE_CACHE.get((symbol, timeframe))
+        if cached and cached["closed_key"] == closed_key:
+            if cached["live_bar"] == live_bar:
+                _FEATURE_CACHE_STATS["hits"] += 1
+                return dict(cached["features"])
+            entry = cached
+            computed = None
+            _FEATURE_CACHE_STATS["live"] += 1
+        else:
+            entry = {"closed_key": closed_key}
+            _FEATURE_CACHE_STATS["full"] += 1
+    if computed is not None:
+        features = computed
+    else:
+        precomputed = None
+        if FEATURE_CACHE_ENABLED and base_data:
+            precomputed = _window_indicators(entry, base_data)
+        windows = rolling_windows(symbol, timeframe, base_data)
+        if windows:
+            precomputed = dict(precomputed or {}, **windows)
+        features = build_features(base_data, precomputed)
+    if live_bar is not None:
+        entry["live_bar"] = live_bar
+        entry["features"] = dict(features)
+        with _INDICATOR_STREAMS_LOCK:
+            _FEATURE_CACHE[(symbol, timeframe)] = entry
     return features
 
 
+def prune_feature_cache(universe: List[str]) -> None:
+    # BTC нужен гейту корреляции даже вне списка пользователя
+    keep = set(universe) | {to_ccxt_symbol("BTCUSDT")}
+    with _INDICATOR_STREAMS_LOCK:
+        for registry in (_FEATURE_CACHE, _BAR_WINDOWS):
+            for key in [key for key in registry if key[0] not in keep]:
+                del registry[key]
+                if registry is _FEATURE_CACHE:
+                    _FEATURE_CACHE_STATS["evicted"] += 1
+        for symbol in [symbol for symbol in _MTF_TREND_CACHE if symbol not in keep]:
+            del _MTF_TREND_CACHE[symbol]
+    # тиры — только для символов вселенной, иначе /status считает выбывшие
+    members = set(universe)
+    for symbol in [symbol for symbol in _SYMBOL_TIERS if symbol not in members]:
+        del _SYMBOL_TIERS[symbol]
+    if OHLCV_DISK_CACHE_ENABLED:
+        prune_ohlcv_disk_cache(keep)
+
+
+def get_feature_cache_stats() -> Dict[str, int]:
+    return dict(_FEATURE_CACHE_STATS, size=len(_FEATURE_CACHE))
+
+
+def _kernel_value(value) -> Optional[float]:
+    value = float(value)
+    return None if math.isnan(value) else value
+
+
+def build_features_batch(series_by_symbol: Dict[str, CandleSeries], timeframe: str = BASE_TIMEFRAME) -> Dict[str, Dict]:
+    # индикаторы считаются матрицей (символы × бары) для символов с одинаковой длиной истории;
+    # уровни, свинги и SMA20/std20 — из скользящих окон символа, как в build_symbol_features
+    groups: Dict[int, List[str]] = {}
+    for symbol, series in series_by_symbol.items():
+        if series and len(series) > 1:
+            groups.setdefault(len(series), []).append(symbol)
+    result = {}
+    for length, symbols in groups.items():
+        columns = {
+            name: np.array([series_by_symbol[symbol][name] for symbol in symbols], dtype=np.float64)
+            for name in ("highs", "lows", "closes")
+        }
+        highs, lows, closes = columns["highs"], columns["lows"], columns["closes"]
+        trs = indicator_kernels.true_range_matrix(highs, lows, closes)
+        plus_dm, minus_dm = indicator_kernels.directional_movement(highs, lows)
+        atr_values = indicator_kernels.atr_last(trs, 14)
+        adx_values = indicator_kernels.adx_last(trs, plus_dm, minus_dm, 14)
+        ema_fast = indicator_kernels.ema_matrix(closes, 50) if length >= 200 else None
+        ema_slow = indicator_kernels.ema_matrix(closes, 200) if length >= 200 else None
+        rsi_values = indicator_kernels.rsi_matrix(closes, 14) if length >= 20 else None
+        for row, symbol in enumerate(symbols):
+            precomputed = {
+                "atr": _kernel_value(atr_values[row]),
+                "adx": _kernel_value(adx_values[row]),
+            }
+            if ema_fast is not None:
+                precomputed["ema_fast_series"] = ema_fast[row].tolist()
+                precomputed["ema_slow_series"] = ema_slow[row].tolist()
+            if rsi_values is not None:
+                precomputed["rsi_series"] = rsi_values[row].tolist()
+            windows = rolling_windows(symbol, timeframe, series_by_symbol[symbol])
+            if windows:
+                precomputed.update(windows)
+            result[symbol] = build_features(series_by_symbol[symbol], precomputed)
+    return result
+
+
 def detect_regime(features: Dict) -> str:
     atr_pct = features.get("atr_pct", 0)
     adx_val = features.get("adx", 0)
@@ -2701,13 +4278,48 @@ def _score_setup(features: Dict, proximity: float, pattern_score: float) -> floa
     return clamp(setup_score, 0, 1)
 
 
+def higher_data_loader(exchange: ccxt.bybit, symbol: str) -> Optional[Callable[[], Optional[CandleSeries]]]:
+    if not ENGINE_V2_USE_MTF:
+        return None
+    return lambda: fetch_ohlcv_cached(exchange, symbol, HIGHER_TIMEFRAME, limit=300, ttl_seconds=None)
+
+
+def higher_timeframe_trend(symbol: str, higher_data: Optional[CandleSeries]) -> Optional[str]:
+    # для MTF нужны только EMA50/EMA200 старшего ТФ по закрытым барам: загрузчик обновляет
+    # кэш только после закрытия бара, формирующийся бар в нём может быть почти часовой давности
+    if not higher_data:
+        return None
+    closed_bars = len(higher_data)
+    if (higher_data.timestamps[-1] / 1000 + timeframe_to_seconds(HIGHER_TIMEFRAME)) > time.time():
+        closed_bars -= 1
+    if closed_bars < 200:
+        return None
+    closes = higher_data["closes"][:closed_bars]
+    key = (higher_data.timestamps[0], higher_data.timestamps[closed_bars - 1], len(closes))
+    with _INDICATOR_STREAMS_LOCK:
+        cached = _MTF_TREND_CACHE.get(symbol)
+    if cached and cached[0] == key:
+        return cached[1]
+    ema_fast_val = ema(closes, 50)[-1]
+    ema_slow_val = ema(closes, 200)[-1]
+    direction = None
+    if ema_fast_val > ema_slow_val:
+        direction = "LONG"
+    elif ema_fast_val < ema_slow_val:
+        direction = "SHORT"
+    with _INDICATOR_STREAMS_LOCK:
+        _MTF_TREND_CACHE[symbol] = (key, direction)
+    return direction
+
+
 def generate_setups(
     symbol: str,
-    base_data: Dict[str, List[float]],
-    higher_data: Optional[Dict[str, List[float]]],
+    base_data: CandleSeries,
+    higher_data: Optional[Callable[[], Optional[CandleSeries]]],
     features: Dict,
     regime: str,
 ) -> List[Dict]:
+    # higher_data — загрузчик старшего ТФ; вызывается только если есть кандидат в сетап
     if regime in {"CHOP", "HIGH_VOLATILITY"}:
         return []
     if features.get("adx", 0) < FILTER_MIN_ADX_SETUP:
@@ -2721,55 +4333,45 @@ def generate_setups(
     compression = features.get("compression", 0.0)
     pattern_score = clamp(1 - (compression / 4), 0, 1) if compression else 0.0
     setups = []
-    price = base_data["closes"][-1]
+    mtf_state: Dict[str, Optional[str]] = {}
 
     def _mtf_direction() -> Optional[str]:
-        if not higher_data or not ENGINE_V2_USE_MTF:
-            return None
-        higher_features = build_features(higher_data)
-        ema_fast_val = higher_features.get("ema_fast")
-        ema_slow_val = higher_features.get("ema_slow")
-        if ema_fast_val is None or ema_slow_val is None:
-            return None
-        if ema_fast_val > ema_slow_val:
-            return "LONG"
-        if ema_fast_val < ema_slow_val:
-            return "SHORT"
-        return None
+        if "direction" not in mtf_state:
+            mtf_state["direction"] = None
+            if higher_data is not None and ENGINE_V2_USE_MTF:
+                mtf_state["direction"] = higher_timeframe_trend(symbol, higher_data())
+        return mtf_state["direction"]
 
-    mtf_direction = _mtf_direction()
     dist_to_high = abs(features.get("dist_to_high_pct", 999))
     dist_to_low = abs(features.get("dist_to_low_pct", 999))
 
     if dist_to_high <= SETUP_DISTANCE_PCT:
-        if mtf_direction in (None, "LONG"):
-            setup_score = _score_setup(features, dist_to_high, pattern_score)
-            if setup_score >= SETUP_MIN_SCORE:
-                setups.append({
-                    "symbol": symbol,
-                    "direction": "LONG",
-                    "level": features.get("high_n_prev"),
-                    "setup_score": setup_score,
-                    "created_at": time.time(),
-                    "expires_at": time.time() + (SETUP_TTL_MINUTES * 60),
-                    "rationale": "trend/volume/compression/level",
-                    "distance_pct": dist_to_high,
-                })
+        setup_score = _score_setup(features, dist_to_high, pattern_score)
+        if setup_score >= SETUP_MIN_SCORE and _mtf_direction() in (None, "LONG"):
+            setups.append({
+                "symbol": symbol,
+                "direction": "LONG",
+                "level": features.get("high_n_prev"),
+                "setup_score": setup_score,
+                "created_at": time.time(),
+                "expires_at": time.time() + (SETUP_TTL_MINUTES * 60),
+                "rationale": "trend/volume/compression/level",
+                "distance_pct": dist_to_high,
+            })
 
     if dist_to_low <= SETUP_DISTANCE_PCT:
-        if mtf_direction in (None, "SHORT"):
-            setup_score = _score_setup(features, dist_to_low, pattern_score)
-            if setup_score >= SETUP_MIN_SCORE:
-                setups.append({
-                    "symbol": symbol,
-                    "direction": "SHORT",
-                    "level": features.get("low_n_prev"),
-                    "setup_score": setup_score,
-                    "created_at": time.time(),
-                    "expires_at": time.time() + (SETUP_TTL_MINUTES * 60),
-                    "rationale": "trend/volume/compression/level",
-                    "distance_pct": dist_to_low,
-                })
+        setup_score = _score_setup(features, dist_to_low, pattern_score)
+        if setup_score >= SETUP_MIN_SCORE and _mtf_direction() in (None, "SHORT"):
+            setups.append({
+                "symbol": symbol,
+                "direction": "SHORT",
+                "level": features.get("low_n_prev"),
+                "setup_score": setup_score,
+                "created_at": time.time(),
+                "expires_at": time.time() + (SETUP_TTL_MINUTES * 60),
+                "rationale": "trend/volume/compression/level",
+                "distance_pct": dist_to_low,
+            })
     return setups
 
 
@@ -2778,18 +4380,16 @@ def _entry_risk_targets(
     entry_price: float,
     level: float,
     atr_val: float,
-    base_data: Dict[str, List[float]],
+    base_data: CandleSeries,
+    features: Optional[Dict] = None,
 ) -> Optional[Dict]:
-    lows = base_data["lows"]
-    highs = base_data["highs"]
+    swing_low, swing_high = _swing_levels(base_data, features)
     if direction == "LONG":
-        swing = min(lows[-20:]) if len(lows) >= 20 else min(lows)
-        sl = min(swing, entry_price - (RISK_ATR_MULT_SL * atr_val))
+        sl = min(swing_low, entry_price - (RISK_ATR_MULT_SL * atr_val))
         risk = entry_price - sl
         tp = entry_price + (RISK_MIN_RR * risk)
     else:
-        swing = max(highs[-20:]) if len(highs) >= 20 else max(highs)
-        sl = max(swing, entry_price + (RISK_ATR_MULT_SL * atr_val))
+        sl = max(swing_high, entry_price + (RISK_ATR_MULT_SL * atr_val))
         risk = sl - entry_price
         tp = entry_price - (RISK_MIN_RR * risk)
     if risk <= 0:
@@ -2803,7 +4403,7 @@ def _entry_risk_targets(
 def check_trigger(
     setup: Dict,
     live_price: float,
-    base_data: Dict[str, List[float]],
+    base_data: CandleSeries,
     features: Dict,
 ) -> Optional[Dict]:
     direction = setup["direction"]
@@ -2820,12 +4420,18 @@ def check_trigger(
     if direction == "LONG":
         breakout_price = level + buffer
         breakout_ok = live_price > breakout_price
-        retest_ok = min(lows[-TRIGGER_RETEST_MAX_BARS:]) <= breakout_price if len(lows) >= TRIGGER_RETEST_MAX_BARS else False
+        retest_low = features.get("retest_low")
+        if retest_low is None and len(lows) >= TRIGGER_RETEST_MAX_BARS:
+            retest_low = min(lows[-TRIGGER_RETEST_MAX_BARS:])
+        retest_ok = retest_low is not None and retest_low <= breakout_price
         momentum_ok = (highs[-1] - highs[-2]) >= TRIGGER_MOMENTUM_ATR_MULT * atr_val if len(highs) > 1 else False
     else:
         breakout_price = level - buffer
         breakout_ok = live_price < breakout_price
-        retest_ok = max(highs[-TRIGGER_RETEST_MAX_BARS:]) >= breakout_price if len(highs) >= TRIGGER_RETEST_MAX_BARS else False
+        retest_high = features.get("retest_high")
+        if retest_high is None and len(highs) >= TRIGGER_RETEST_MAX_BARS:
+            retest_high = max(highs[-TRIGGER_RETEST_MAX_BARS:])
+        retest_ok = retest_high is not None and retest_high >= breakout_price
         momentum_ok = (lows[-2] - lows[-1]) >= TRIGGER_MOMENTUM_ATR_MULT * atr_val if len(lows) > 1 else False
 
     if TRIGGER_CONFIRM_MODE == "close":
@@ -2844,7 +4450,7 @@ def check_trigger(
         return None
 
     entry_price = live_price
-    risk_targets = _entry_risk_targets(direction, entry_price, level, atr_val, base_data)
+    risk_targets = _entry_risk_targets(direction, entry_price, level, atr_val, base_data, features)
     if not risk_targets:
         return None
 
@@ -2953,19 +4559,22 @@ def engine_v2_cycle(
     leverage_value = int(settings_snapshot["leverage"])
     position_usd = float(settings_snapshot["position_usd"])
     enabled_symbols = get_combined_symbols(state)
-    for symbol in enabled_symbols:
-        # 15m TTL = 25s, 1h TTL = 600s (anti rate-limit, no behavior change)
-        base_parsed = fetch_ohlcv_cached(exchange, symbol, BASE_TIMEFRAME, limit=300, ttl_seconds=25)
-        if not base_parsed:
+    prune_feature_cache(enabled_symbols)
+    # старший ТФ не префетчим: generate_setups грузит его лениво, только для кандидатов
+    prefetch_windows = [(BASE_TIMEFRAME, 300, OHLCV_FORMING_BAR_TTL_SECONDS)]
+    prefetch_ohlcv(exchange, enabled_symbols, prefetch_windows)
+    set_ticker_universe(enabled_symbols)
+    deferred: List[str] = []
+    for symbol in iter_symbols_with_retries(enabled_symbols, deferred):
+        # закрытые бары не перекачиваем; 15m формирующийся бар — раз в 25с, 1h — сразу после закрытия
+        base_data = fetch_cycle_ohlcv(exchange, symbol)
+        if not base_data:
+            defer_if_rate_limited(symbol, deferred)
             continue
-        base_data = _parsed_to_dict(base_parsed)
         if len(base_data["closes"]) < 220:
             continue
-        higher_data = None
-        if ENGINE_V2_USE_MTF:
-            higher_parsed = fetch_ohlcv_cached(exchange, symbol, HIGHER_TIMEFRAME, limit=300, ttl_seconds=600)
-            higher_data = _parsed_to_dict(higher_parsed) if higher_parsed else None
-        features = build_features(base_data)
+        higher_data = higher_data_loader(exchange, symbol)
+        features = build_symbol_features(symbol, base_data)
         if not features:
             continue
         regime = detect_regime(features)
@@ -3013,6 +4622,7 @@ def engine_v2_cycle(
             has_active_setup=True,
         )
         if live_price is None:
+            defer_if_rate_limited(symbol, deferred)
             continue
         for setup_key, setup in symbol_setups:
             if setup.get("symbol") != symbol:
@@ -3030,10 +4640,7 @@ def engine_v2_cycle(
                 continue
 
             atr_val = features.get("atr")
-            lows = base_data["lows"]
-            highs = base_data["highs"]
-            swing_low = min(lows[-20:]) if len(lows) >= 20 else min(lows)
-            swing_high = max(highs[-20:]) if len(highs) >= 20 else max(highs)
+            swing_low, swing_high = _swing_levels(base_data, features)
             risk_result = evaluate_risk(
                 direction=direction,
                 entry_price=entry["entry_price"],
@@ -3232,43 +4839,111 @@ def _append_decision_log(state: Dict, payload: Dict) -> None:
         state["decision_log"] = log
 
 
-def _compute_returns(closes: List[float], window: int = 120) -> List[float]:
-    if len(closes) < window + 1:
-        return []
-    sliced = closes[-(window + 1):]
-    returns = []
-    for prev, current in zip(sliced[:-1], sliced[1:]):
-        if prev <= 0:
-            return []
-        returns.append((current - prev) / prev)
-    return returns
-
-
-def _pearson_corr(values_a: List[float], values_b: List[float]) -> Optional[float]:
-    if not values_a or not values_b or len(values_a) != len(values_b):
+def _grid_closes(series: Optional[CandleSeries], end_ts: int, timeframe_ms: int, window: int) -> Optional[np.ndarray]:
+    # закрытия на сетке end_ts - window*tf ... end_ts; пропущенные (и нулевые) бары — NaN
+    if not series:
         return None
-    n = len(values_a)
-    mean_a = sum(values_a) / n
-    mean_b = sum(values_b) / n
-    cov = sum((a - mean_a) * (b - mean_b) for a, b in zip(values_a, values_b))
-    var_a = sum((a - mean_a) ** 2 for a in values_a)
-    var_b = sum((b - mean_b) ** 2 for b in values_b)
-    if var_a == 0 or var_b == 0:
+    start_ts = end_ts - window * timeframe_ms
+    timestamps = series.timestamps
+    lo = bisect_left(timestamps, start_ts)
+    hi = bisect_left(timestamps, end_ts + 1)
+    if hi <= lo:
         return None
-    return cov / (var_a ** 0.5 * var_b ** 0.5)
+    offsets = np.asarray(timestamps[lo:hi], dtype=np.int64) - start_ts
+    closes = np.asarray(series.closes[lo:hi], dtype=np.float64)
+    on_grid = (offsets % timeframe_ms == 0) & (closes > 0)
+    grid = np.full(window + 1, np.nan)
+    grid[offsets[on_grid] // timeframe_ms] = closes[on_grid]
+    return grid
+
+
+def _build_correlation_matrix(
+    symbols: Sequence[str],
+    end_ts: int,
+) -> Tuple[Dict[str, int], np.ndarray, np.ndarray]:
+    # корреляция каждой пары — по доходностям, которые есть у обоих символов (дыра в одном
+    # ряду не выбрасывает его из матрицы); (индекс, матрица, число общих доходностей)
+    timeframe_ms = timeframe_to_seconds(BASE_TIMEFRAME) * 1000
+    window = ENGINE_V3_CORR_RETURNS_WINDOW
+    index: Dict[str, int] = {}
+    rows = []
+    for symbol in symbols:
+        cached = _OHLCV_CACHE.get((symbol, BASE_TIMEFRAME))
+        closes = _grid_closes(cached.series if cached else None, end_ts, timeframe_ms, window)
+        if closes is None:
+            continue
+        returns = (closes[1:] - closes[:-1]) / closes[:-1]
+        if np.count_nonzero(~np.isnan(returns)) < ENGINE_V3_CORR_MIN_OVERLAP:
+            continue
+        index[symbol] = len(rows)
+        rows.append(returns)
+    if not rows:
+        return index, np.empty((0, 0)), np.empty((0, 0))
+    returns_matrix = np.array(rows, dtype=np.float64)
+    present = ~np.isnan(returns_matrix)
+    # отклонения от среднего ряда убирают потерю точности в суммах по парам
+    deviations = np.where(present, returns_matrix - np.nanmean(returns_matrix, axis=1, keepdims=True), 0.0)
+    mask = present.astype(np.float64)
+    overlap = mask @ mask.T
+    sums = deviations @ mask.T  # sums[i, j] — сумма отклонений i на общих с j барах
+    squares = (deviations * deviations) @ mask.T
+    with np.errstate(divide="ignore", invalid="ignore"):
+        covariance = deviations @ deviations.T - sums * sums.T / overlap
+        variance_a = squares - sums * sums / overlap
+        variance_b = variance_a.T
+        matrix = covariance / np.sqrt(variance_a * variance_b)
+    matrix[(overlap < ENGINE_V3_CORR_MIN_OVERLAP) | (variance_a <= 0) | (variance_b <= 0)] = np.nan
+    return index, matrix, overlap
+
+
+def update_correlation_matrix(symbols: Sequence[str]) -> None:
+    # матрица корреляций доходностей по закрытым барам; до закрытия следующего бара
+    # пересчитывается только если спросили символ, которого в ней ещё нет
+    timeframe_ms = timeframe_to_seconds(BASE_TIMEFRAME) * 1000
+    end_ts = (int(time.time() * 1000) // timeframe_ms) * timeframe_ms - timeframe_ms
+    with _CORRELATION_LOCK:
+        known = set(_CORRELATION_STATE["requested"])  # type: ignore[arg-type]
+        if _CORRELATION_STATE["bar_ts"] == end_ts and known.issuperset(symbols):
+            return
+        if _CORRELATION_STATE["bar_ts"] != end_ts:
+            known = set()
+        requested = sorted(known.union(symbols))
+        index, matrix, overlap = _build_correlation_matrix(requested, end_ts)
+        _CORRELATION_STATE.update({
+            "bar_ts": end_ts,
+            "index": index,
+            "matrix": matrix,
+            "overlap": overlap,
+            "requested": requested,
+        })
+
+
+def return_correlation(symbol_a: str, symbol_b: str) -> Tuple[Optional[float], str]:
+    update_correlation_matrix([symbol_a, symbol_b])
+    with _CORRELATION_LOCK:
+        index = _CORRELATION_STATE["index"]
+        matrix = _CORRELATION_STATE["matrix"]
+        if symbol_a not in index or symbol_b not in index:  # type: ignore[operator]
+            return None, "returns_missing"
+        row, column = index[symbol_a], index[symbol_b]  # type: ignore[index]
+        if _CORRELATION_STATE["overlap"][row, column] < ENGINE_V3_CORR_MIN_OVERLAP:  # type: ignore[index]
+            return None, "returns_missing"
+        value = float(matrix[row, column])  # type: ignore[index]
+    if math.isnan(value):
+        return None, "corr_missing"
+    return value, "ok"
 
 
 def _fetch_btc_context(exchange: ccxt.bybit) -> Optional[Dict]:
     btc_symbol = to_ccxt_symbol("BTCUSDT")
-    base_parsed = fetch_ohlcv_cached(exchange, btc_symbol, BASE_TIMEFRAME, limit=300, ttl_seconds=25)
-    if not base_parsed:
+    base_data = fetch_ohlcv_cached(exchange, btc_symbol, BASE_TIMEFRAME, limit=300, ttl_seconds=OHLCV_FORMING_BAR_TTL_SECONDS)
+    if not base_data:
         return None
-    base_data = _parsed_to_dict(base_parsed)
     timeframe_seconds = timeframe_to_seconds(BASE_TIMEFRAME)
-    ok, _ = data_integrity_gate(btc_symbol, base_data, timeframe_seconds)
+    base_data, ok, _ = repair_and_check_integrity(exchange, btc_symbol, base_data, timeframe_seconds)
     if not ok:
         return None
-    features = build_features(base_data)
+    features = build_symbol_features(btc_symbol, base_data)
     if not features:
         return None
     regime = detect_regime(features)
@@ -3283,21 +4958,15 @@ def _fetch_btc_context(exchange: ccxt.bybit) -> Optional[Dict]:
 def _passes_correlation_gate(
     symbol: str,
     direction: str,
-    base_data: Dict[str, List[float]],
     btc_context: Optional[Dict],
 ) -> Tuple[bool, str]:
     if normalize_symbol(symbol) == "BTC":
         return True, "btc_self"
     if not btc_context:
         return False, "btc_context_missing"
-    btc_closes = btc_context["data"].get("closes", [])
-    symbol_returns = _compute_returns(base_data.get("closes", []))
-    btc_returns = _compute_returns(btc_closes)
-    if not symbol_returns or not btc_returns:
-        return False, "returns_missing"
-    corr = _pearson_corr(symbol_returns, btc_returns)
+    corr, corr_status = return_correlation(symbol, btc_context["symbol"])
     if corr is None:
-        return False, "corr_missing"
+        return False, corr_status
     btc_regime = btc_context.get("regime")
     btc_trend = None
     if btc_regime == "TREND_UP":
@@ -3314,7 +4983,7 @@ def _passes_correlation_gate(
 
 def _passes_spread_gate(exchange: ccxt.bybit, symbol: str) -> Tuple[bool, str]:
     try:
-        ticker = exchange.fetch_ticker(symbol)
+        ticker = fetch_ticker_snapshot(exchange, symbol)
     except Exception as e:
         if _is_rate_limit_error(e):
             _log_rate_limit_once(f"fetch_ticker {symbol}")
@@ -3358,18 +5027,14 @@ def _compute_probability(
 
 def engine_v3_analyze(exchange: ccxt.bybit, state: Dict, symbol: str) -> Dict:
     timeframe_seconds = timeframe_to_seconds(BASE_TIMEFRAME)
-    base_parsed = fetch_ohlcv_cached(exchange, symbol, BASE_TIMEFRAME, limit=300, ttl_seconds=25)
-    if not base_parsed:
+    base_data = fetch_ohlcv_cached(exchange, symbol, BASE_TIMEFRAME, limit=300, ttl_seconds=OHLCV_FORMING_BAR_TTL_SECONDS)
+    if not base_data:
         return {"status": "error", "error": "Данные недоступны."}
-    base_data = _parsed_to_dict(base_parsed)
-    ok, reason = data_integrity_gate(symbol, base_data, timeframe_seconds)
+    base_data, ok, reason = repair_and_check_integrity(exchange, symbol, base_data, timeframe_seconds)
     if not ok:
         return {"status": "none", "reason": reason}
-    higher_data = None
-    if ENGINE_V2_USE_MTF:
-        higher_parsed = fetch_ohlcv_cached(exchange, symbol, HIGHER_TIMEFRAME, limit=300, ttl_seconds=600)
-        higher_data = _parsed_to_dict(higher_parsed) if higher_parsed else None
-    features = build_features(base_data)
+    higher_data = higher_data_loader(exchange, symbol)
+    features = build_symbol_features(symbol, base_data)
     if not features:
         return {"status": "none"}
     regime = detect_regime(features)
@@ -3396,7 +5061,7 @@ def engine_v3_analyze(exchange: ccxt.bybit, state: Dict, symbol: str) -> Dict:
     if regime in {"CHOP", "HIGH_VOLATILITY"}:
         return {"status": "none"}
     btc_context = _fetch_btc_context(exchange)
-    corr_ok, _ = _passes_correlation_gate(symbol, best_entry["setup"]["direction"], base_data, btc_context)
+    corr_ok, _ = _passes_correlation_gate(symbol, best_entry["setup"]["direction"], btc_context)
     if not corr_ok:
         return {"status": "none"}
     spread_ok, _ = _passes_spread_gate(exchange, symbol)
@@ -3404,10 +5069,7 @@ def engine_v3_analyze(exchange: ccxt.bybit, state: Dict, symbol: str) -> Dict:
         return {"status": "none"}
     settings = get_settings_snapshot(state)
     atr_val = features.get("atr")
-    lows = base_data["lows"]
-    highs = base_data["highs"]
-    swing_low = min(lows[-20:]) if len(lows) >= 20 else min(lows)
-    swing_high = max(highs[-20:]) if len(highs) >= 20 else max(highs)
+    swing_low, swing_high = _swing_levels(base_data, features)
     risk_result = evaluate_risk(
         direction=best_entry["setup"]["direction"],
         entry_price=best_entry["entry"]["entry_price"],
@@ -3440,6 +5102,88 @@ def engine_v3_analyze(exchange: ccxt.bybit, state: Dict, symbol: str) -> Dict:
     return {"status": "entry", "message": message}
 
 
+def classify_symbol_tier(features: Dict, has_open_setup: bool) -> str:
+    if has_open_setup:
+        return "hot"
+    distance = min(
+        abs(features.get("dist_to_high_pct", 999)),
+        abs(features.get("dist_to_low_pct", 999)),
+    )
+    if distance <= SETUP_DISTANCE_PCT * SYMBOL_TIER_HOT_DISTANCE_MULT:
+        return "hot"
+    if distance <= SETUP_DISTANCE_PCT * SYMBOL_TIER_WARM_DISTANCE_MULT:
+        return "warm"
+    return "cold"
+
+
+def update_symbol_tier(symbol: str, features: Dict, has_open_setup: bool, new_setup: bool = False) -> None:
+    entry = _SYMBOL_TIERS.setdefault(symbol, {})
+    if new_setup:
+        entry["setup_ts"] = time.time()
+    entry["tier"] = classify_symbol_tier(features, has_open_setup or new_setup)
+
+
+def recent_setup_symbols() -> set:
+    # engine v3 не ведёт open_setups: сетап считается открытым SETUP_TTL_MINUTES после генерации
+    cutoff = time.time() - SETUP_TTL_MINUTES * 60
+    return {symbol for symbol, entry in _SYMBOL_TIERS.items() if float(entry.get("setup_ts", 0)) >= cutoff}  # type: ignore[arg-type]
+
+
+def select_symbols_for_cycle(symbols: List[str], pinned: set) -> List[str]:
+    # hot — каждый цикл, warm/cold — раз в N циклов; новые символы сканируются сразу
+    _SCHEDULER_STATE["cycle"] += 1
+    cycle = _SCHEDULER_STATE["cycle"]
+    intervals = {"hot": 1, "warm": SYMBOL_TIER_WARM_EVERY_CYCLES, "cold": SYMBOL_TIER_COLD_EVERY_CYCLES}
+    due = []
+    for symbol in symbols:
+        entry = _SYMBOL_TIERS.setdefault(symbol, {})
+        tier = "hot" if symbol in pinned else entry.get("tier", "hot")
+        last_cycle = int(entry.get("last_cycle", 0))
+        if last_cycle and cycle - last_cycle < intervals.get(tier, 1):
+            continue
+        entry["last_cycle"] = cycle
+        due.append(symbol)
+    return due
+
+
+def get_symbol_tier_counts() -> Dict[str, int]:
+    counts = {"hot": 0, "warm": 0, "cold": 0}
+    for entry in _SYMBOL_TIERS.values():
+        tier = entry.get("tier")
+        if tier in counts:
+            counts[tier] += 1
+    return counts
+
+
+def prefilter_setup_candidate(base_data: CandleSeries) -> Tuple[bool, str, Dict]:
+    # те же условия, что в generate_setups (дистанция до уровня, объём), но по сырым
+    # колонкам, без индикаторов; короткую историю пропускаем — её отсеют следующие стадии
+    highs = base_data["highs"]
+    lows = base_data["lows"]
+    closes = base_data["closes"]
+    volumes = base_data["volumes"]
+    n = FeatureGraph.LEVEL_BARS
+    if len(closes) < n + 1 or len(volumes) < 20:
+        return True, "short_history", {}
+    price = closes[-1]
+    if not price:
+        return True, "zero_price", {}
+    quick = {
+        "dist_to_high_pct": ((max(highs[-n - 1:-1]) - price) / price) * 100,
+        "dist_to_low_pct": ((price - min(lows[-n - 1:-1])) / price) * 100,
+    }
+    if min(abs(quick["dist_to_high_pct"]), abs(quick["dist_to_low_pct"])) > SETUP_DISTANCE_PCT:
+        return False, "level_distance", quick
+    vol_sma20 = sum(volumes[-20:]) / 20
+    if vol_sma20 <= 0 or volumes[-1] / vol_sma20 < FILTER_MIN_VOL_RATIO_SETUP:
+        return False, "volume", quick
+    return True, "ok", quick
+
+
+def get_engine_v3_stage_counts() -> Dict[str, int]:
+    return dict(_ENGINE_V3_STAGE_COUNTS)
+
+
 def engine_v3_cycle(
     exchange: ccxt.bybit,
     state: Dict,
@@ -3453,32 +5197,75 @@ def engine_v3_cycle(
     leverage_value = int(settings_snapshot["leverage"])
     position_usd = float(settings_snapshot["position_usd"])
     enabled_symbols = get_combined_symbols(state)
+    prune_feature_cache(enabled_symbols)
+    pinned_symbols = recent_setup_symbols()
+    if SYMBOL_TIERS_ENABLED and allow_cooldown:
+        # ручной /now (allow_cooldown=False) всегда проходит по всем символам
+        enabled_symbols = select_symbols_for_cycle(enabled_symbols, pinned_symbols)
     timeframe_seconds = timeframe_to_seconds(BASE_TIMEFRAME)
+    # старший ТФ не префетчим: generate_setups грузит его лениво, только для кандидатов
+    prefetch_windows = [(BASE_TIMEFRAME, 300, OHLCV_FORMING_BAR_TTL_SECONDS)]
+    prefetch_ohlcv(exchange, enabled_symbols, prefetch_windows)
+    set_ticker_universe(enabled_symbols)
     btc_context = _fetch_btc_context(exchange)
+    if btc_context:
+        # одна матрица доходностей на всю вселенную — гейт по BTC читает из неё
+        update_correlation_matrix(list(enabled_symbols) + [btc_context["symbol"]])
     candidates = []
+    deferred: List[str] = []
+    # после prefetch окна берутся из кэша; индикаторы считаются сразу по всей вселенной
+    base_windows = {symbol: fetch_cycle_ohlcv(exchange, symbol) for symbol in enabled_symbols}
+    # дешёвые проверки — первыми; целостность и индикаторы только для прошедших
+    prefiltered = {}
+    if ENGINE_V3_PREFILTER_ENABLED and ENGINE_V2_SETUP_ENABLED:
+        prefiltered = {symbol: prefilter_setup_candidate(data) for symbol, data in base_windows.items() if data}
+    # матрицей считаются только полные промахи memo; при попадании и при смене одного
+    # живого бара признаки берутся из memo в build_symbol_features
+    batch_features = build_features_batch({
+        symbol: data
+        for symbol, data in base_windows.items()
+        if data
+        and (symbol not in prefiltered or prefiltered[symbol][0])
+        and feature_memo_status(symbol, data) == "full"
+    })
+    stage_counts = {"symbols": len(enabled_symbols), "data": 0, "prefilter": 0, "integrity": 0, "features": 0, "setups": 0, "entries": 0}
 
-    for symbol in enabled_symbols:
-        base_parsed = fetch_ohlcv_cached(exchange, symbol, BASE_TIMEFRAME, limit=300, ttl_seconds=25)
-        if not base_parsed:
+    for symbol in iter_symbols_with_retries(enabled_symbols, deferred):
+        base_data = base_windows.pop(symbol, None) or fetch_cycle_ohlcv(exchange, symbol)
+        precomputed_features = batch_features.pop(symbol, None)
+        if not base_data:
+            if defer_if_rate_limited(symbol, deferred):
+                continue
             _append_decision_log(state, {"ts": time.time(), "symbol": symbol, "stage": "data", "reason": "no_ohlcv"})
             continue
-        base_data = _parsed_to_dict(base_parsed)
-        ok, reason = data_integrity_gate(symbol, base_data, timeframe_seconds)
+        stage_counts["data"] += 1
+        if ENGINE_V3_PREFILTER_ENABLED and ENGINE_V2_SETUP_ENABLED:
+            passed, _, quick = prefiltered.pop(symbol, None) or prefilter_setup_candidate(base_data)
+            if not passed:
+                # тир считается по тем же дистанциям до уровней, что и в признаках
+                update_symbol_tier(symbol, quick, symbol in pinned_symbols)
+                continue
+        stage_counts["prefilter"] += 1
+        checked_data, ok, reason = repair_and_check_integrity(exchange, symbol, base_data, timeframe_seconds)
         if not ok:
             _append_decision_log(state, {"ts": time.time(), "symbol": symbol, "stage": "gate", "reason": reason})
             continue
-        higher_data = None
-        if ENGINE_V2_USE_MTF:
-            higher_parsed = fetch_ohlcv_cached(exchange, symbol, HIGHER_TIMEFRAME, limit=300, ttl_seconds=600)
-            higher_data = _parsed_to_dict(higher_parsed) if higher_parsed else None
-        features = build_features(base_data)
+        stage_counts["integrity"] += 1
+        if checked_data is not base_data:
+            precomputed_features = None
+        base_data = checked_data
+        higher_data = higher_data_loader(exchange, symbol)
+        features = build_symbol_features(symbol, base_data, computed=precomputed_features)
         if not features:
             _append_decision_log(state, {"ts": time.time(), "symbol": symbol, "stage": "features", "reason": "empty"})
             continue
+        stage_counts["features"] += 1
         regime = detect_regime(features)
         setups = generate_setups(symbol, base_data, higher_data, features, regime) if ENGINE_V2_SETUP_ENABLED else []
+        update_symbol_tier(symbol, features, symbol in pinned_symbols, new_setup=bool(setups))
         if not setups:
             continue
+        stage_counts["setups"] += 1
         live_price = get_live_price_if_needed(
             exchange,
             symbol,
@@ -3486,6 +5273,8 @@ def engine_v3_cycle(
             has_active_setup=True,
         )
         if live_price is None:
+            if defer_if_rate_limited(symbol, deferred):
+                continue
             _append_decision_log(state, {"ts": time.time(), "symbol": symbol, "stage": "price", "reason": "unavailable"})
             continue
         for setup in setups:
@@ -3508,22 +5297,25 @@ def engine_v3_cycle(
                 "regime": regime,
                 "base_data": base_data,
             })
+            stage_counts["entries"] += 1
+
+    _ENGINE_V3_STAGE_COUNTS.clear()
+    _ENGINE_V3_STAGE_COUNTS.update(stage_counts)
+    print("[ENGINE_V3] stages " + " ".join(f"{name}={count}" for name, count in stage_counts.items()))
 
     if not candidates:
         return last_signal
 
-    vetted_candidates = []
+    gated_candidates = []
     for candidate in candidates:
         symbol = candidate["symbol"]
         direction = candidate["direction"]
-        entry = candidate["entry"]
         regime = candidate["regime"]
-        base_data = candidate["base_data"]
 
         if regime in {"CHOP", "HIGH_VOLATILITY"}:
             _append_decision_log(state, {"ts": time.time(), "symbol": symbol, "stage": "regime", "reason": regime})
             continue
-        corr_ok, corr_reason = _passes_correlation_gate(symbol, direction, base_data, btc_context)
+        corr_ok, corr_reason = _passes_correlation_gate(symbol, direction, btc_context)
         if not corr_ok:
             _append_decision_log(state, {"ts": time.time(), "symbol": symbol, "stage": "correlation", "reason": corr_reason})
             continue
@@ -3531,21 +5323,26 @@ def engine_v3_cycle(
         if not spread_ok:
             _append_decision_log(state, {"ts": time.time(), "symbol": symbol, "stage": "spread", "reason": spread_reason})
             continue
-
-        atr_val = candidate["features"].get("atr")
-        lows = base_data["lows"]
-        highs = base_data["highs"]
-        swing_low = min(lows[-20:]) if len(lows) >= 20 else min(lows)
-        swing_high = max(highs[-20:]) if len(highs) >= 20 else max(highs)
-        risk_result = evaluate_risk(
-            direction=direction,
-            entry_price=entry["entry_price"],
-            atr=atr_val,
-            swing_high=swing_high,
-            swing_low=swing_low,
-            leverage=leverage_value,
-            position_usd=position_usd,
-        )
+        gated_candidates.append(candidate)
+
+    # риск всех прошедших гейты кандидатов — одним векторным вызовом
+    swings = [_swing_levels(candidate["base_data"], candidate["features"]) for candidate in gated_candidates]
+    risk_batch = evaluate_risk_batch(
+        [candidate["direction"] for candidate in gated_candidates],
+        [candidate["entry"]["entry_price"] for candidate in gated_candidates],
+        [candidate["features"].get("atr") for candidate in gated_candidates],
+        [swing_high for _, swing_high in swings],
+        [swing_low for swing_low, _ in swings],
+        [leverage_value],
+        [position_usd],
+    )
+    vetted_candidates = []
+    for index, candidate in enumerate(gated_candidates):
+        symbol = candidate["symbol"]
+        direction = candidate["direction"]
+        entry = candidate["entry"]
+        regime = candidate["regime"]
+        risk_result = risk_result_at(risk_batch, index)
         if not risk_result.get("ok"):
             _append_decision_log(state, {"ts": time.time(), "symbol": symbol, "stage": "risk", "reason": risk_result.get("reason")})
             continue
@@ -3618,8 +5415,7 @@ def run_signal_cycle(
 
     def _fetch(symbol: str):
         try:
-            # 15m TTL = 25s, 1h TTL = 600s (anti rate-limit, no behavior change)
-            ohlcv = fetch_ohlcv_raw_cached(exchange, symbol, TIMEFRAME, limit=300, ttl_seconds=25)
+            ohlcv = fetch_ohlcv_raw_cached(exchange, symbol, TIMEFRAME, limit=300, ttl_seconds=OHLCV_FORMING_BAR_TTL_SECONDS)
             if not ohlcv:
                 return symbol, None, RuntimeError("empty ohlcv")
             df = pd.DataFrame(ohlcv, columns=["ts", "open", "high", "low", "close", "volume"])
@@ -3770,7 +5566,7 @@ def command_loop(state: Dict, manual_engine: ManualMemoryEngine) -> None:
     # flush old updates on startup (do not process backlog)
     try:
         url = f"https://api.telegram.org/bot{TELEGRAM_BOT_TOKEN}/getUpdates"
-        r = requests.get(url, params={"timeout": 0}, timeout=10)
+        r = _HTTP.get(url, params={"timeout": 0}, timeout=(3, 10))
         data = r.json()
         if data.get("ok") and data.get("result"):
             update_offset = data["result"][-1]["update_id"] + 1
@@ -4404,7 +6200,14 @@ def command_loop(state: Dict, manual_engine: ManualMemoryEngine) -> None:
 
 def signal_loop(exchange: ccxt.bybit, state: Dict) -> None:
     print("Signal loop started")
-    next_run = time.time() + CHECK_EVERY_SECONDS
+    # первый цикл сразу — только если свечи действительно поднялись с диска
+    loaded = 0
+    if OHLCV_DISK_CACHE_ENABLED:
+        with state_lock:
+            symbols = get_combined_symbols(state)
+        loaded = load_ohlcv_disk_cache(symbols + [to_ccxt_symbol("BTCUSDT")])
+        print(f"[DATA] ohlcv disk cache: loaded {loaded}/{len(symbols)} series")
+    next_run = time.time() if loaded else time.time() + CHECK_EVERY_SECONDS
 
     while True:
         run_now_chat_id = None
@@ -4451,12 +6254,8 @@ def main() -> None:
             "Please set environment variable TELEGRAM_BOT_TOKEN."
         )
         raise SystemExit(1)
-    exchange = ccxt.bybit({
-        "apiKey": BYBIT_API_KEY,
-        "secret": BYBIT_API_SECRET,
-        "enableRateLimit": True,
-        "options": {"defaultType": "swap"},  # фьючерсы (USDT Perpetual)
-    })
+    exchange_pool = build_exchange_pool()
+    share_exchange_markets(exchange_pool)
 
     with state_lock:
         state = load_state()
@@ -4513,11 +6312,11 @@ def main() -> None:
     with state_lock:
         news_enabled = state.get("news_settings", {}).get("enabled", NEWS_ENABLED)
     if news_enabled:
-        news_thread = threading.Thread(target=news_worker, args=(exchange, state), daemon=True)
+        news_thread = threading.Thread(target=news_worker, args=(exchange_pool["news"], state), daemon=True)
         news_thread.start()
 
     manual_engine = ManualMemoryEngine(
-        exchange=exchange,
+        exchange=exchange_pool["interactive"],
         state_getter=lambda: state,
         state_saver=save_state,
         logger=print,
@@ -4525,7 +6324,7 @@ def main() -> None:
     )
 
     command_thread = threading.Thread(target=command_loop, args=(state, manual_engine), daemon=True)
-    signal_thread = threading.Thread(target=signal_loop, args=(exchange, state), daemon=True)
+    signal_thread = threading.Thread(target=signal_loop, args=(exchange_pool["scan"], state), daemon=True)
     command_thread.start()
     signal_thread.start()
 
@@ -0,0 +1,135 @@
+import sys
+from typing import Tuple
+
+import numpy as np
+
+# Векторные версии ema/rsi/atr/adx из bybit_signal_bot: матрица (символы × бары),
+# рекурсии идут по барам, а операции — сразу по всем символам. Порядок операций
+# повторяет скалярный код, поэтому результаты совпадают бит в бит.
+
+# sum() во float начиная с 3.12 использует суммирование Ноймайера
+_COMPENSATED_SUM = sys.version_info >= (3, 12)
+
+
+def as_matrix(values) -> np.ndarray:
+    return np.atleast_2d(np.asarray(values, dtype=np.float64))
+
+
+def sequential_sum(matrix: np.ndarray) -> np.ndarray:
+    # sum() по строкам в том же порядке, что и встроенный sum() (np.sum — попарный)
+    total = np.zeros(matrix.shape[0])
+    if not _COMPENSATED_SUM:
+        for column in range(matrix.shape[1]):
+            total = total + matrix[:, column]
+        return total
+    compensation = np.zeros(matrix.shape[0])
+    for column in range(matrix.shape[1]):
+        value = matrix[:, column]
+        updated = total + value
+        compensation = compensation + np.where(
+            np.abs(total) >= np.abs(value),
+            (total - updated) + value,
+            (value - updated) + total,
+        )
+        total = updated
+    apply = (compensation != 0) & np.isfinite(compensation)
+    return np.where(apply, total + compensation, total)
+
+
+def ema_matrix(values, period: int) -> np.ndarray:
+    values = as_matrix(values)
+    k = 2 / (period + 1)
+    out = np.empty_like(values)
+    out[:, 0] = values[:, 0]
+    for column in range(1, values.shape[1]):
+        previous = out[:, column - 1]
+        out[:, column] = previous + k * (values[:, column] - previous)
+    return out
+
+
+def rsi_matrix(values, period: int = 14) -> np.ndarray:
+    values = as_matrix(values)
+    rows, bars = values.shape
+    out = np.full((rows, bars), 50.0)
+    diffs = values[:, 1:] - values[:, :-1]
+    if diffs.shape[1] < period:
+        return out
+    gains = np.maximum(diffs, 0)
+    losses = np.maximum(-diffs, 0)
+    steps = diffs.shape[1] - period
+    if steps <= 0:
+        return out
+    # рекурсия — по барам, сама формула RSI — одним проходом по всей матрице
+    avg_gains = np.empty((rows, steps))
+    avg_losses = np.empty((rows, steps))
+    avg_gain = sequential_sum(gains[:, :period]) / period
+    avg_loss = sequential_sum(losses[:, :period]) / period
+    for step in range(steps):
+        avg_gain = (avg_gain * (period - 1) + gains[:, period + step]) / period
+        avg_loss = (avg_loss * (period - 1) + losses[:, period + step]) / period
+        avg_gains[:, step] = avg_gain
+        avg_losses[:, step] = avg_loss
+    with np.errstate(divide="ignore", invalid="ignore"):
+        rs = avg_gains / avg_losses
+        out[:, period + 1:] = np.where(avg_losses == 0, 100.0, 100 - (100 / (1 + rs)))
+    return out
+
+
+def true_range_matrix(highs, lows, closes) -> np.ndarray:
+    highs = as_matrix(highs)
+    lows = as_matrix(lows)
+    closes = as_matrix(closes)
+    previous_close = closes[:, :-1]
+    return np.maximum(
+        np.maximum(highs[:, 1:] - lows[:, 1:], np.abs(highs[:, 1:] - previous_close)),
+        np.abs(lows[:, 1:] - previous_close),
+    )
+
+
+def atr_last(trs: np.ndarray, period: int = 14) -> np.ndarray:
+    # последнее значение ATR по готовому true range; NaN там, где скалярный atr() вернул бы None
+    if trs.shape[1] < period:
+        return np.full(trs.shape[0], np.nan)
+    atr_value = sequential_sum(trs[:, :period]) / period
+    for index in range(period, trs.shape[1]):
+        atr_value = (atr_value * (period - 1) + trs[:, index]) / period
+    return atr_value
+
+
+def directional_movement(highs, lows) -> Tuple[np.ndarray, np.ndarray]:
+    highs = as_matrix(highs)
+    lows = as_matrix(lows)
+    up_move = highs[:, 1:] - highs[:, :-1]
+    down_move = lows[:, :-1] - lows[:, 1:]
+    plus_dm = np.where((up_move > down_move) & (up_move > 0), up_move, 0.0)
+    minus_dm = np.where((down_move > up_move) & (down_move > 0), down_move, 0.0)
+    return plus_dm, minus_dm
+
+
+def adx_last(trs: np.ndarray, plus_dm: np.ndarray, minus_dm: np.ndarray, period: int = 14) -> np.ndarray:
+    rows, count = trs.shape
+    if count + 1 < (period * 2) + 1 or count - period < period:
+        return np.full(rows, np.nan)
+    tr_smooth = sequential_sum(trs[:, :period])
+    plus_smooth = sequential_sum(plus_dm[:, :period])
+    minus_smooth = sequential_sum(minus_dm[:, :period])
+    tr_smoothed = np.empty((rows, count - period))
+    plus_smoothed = np.empty((rows, count - period))
+    minus_smoothed = np.empty((rows, count - period))
+    for index in range(period, count):
+        tr_smooth = tr_smooth - (tr_smooth / period) + trs[:, index]
+        plus_smooth = plus_smooth - (plus_smooth / period) + plus_dm[:, index]
+        minus_smooth = minus_smooth - (minus_smooth / period) + minus_dm[:, index]
+        tr_smoothed[:, index - period] = tr_smooth
+        plus_smoothed[:, index - period] = plus_smooth
+        minus_smoothed[:, index - period] = minus_smooth
+    with np.errstate(divide="ignore", invalid="ignore"):
+        plus_di = 100 * (plus_smoothed / tr_smoothed)
+        minus_di = 100 * (minus_smoothed / tr_smoothed)
+        di_sum = plus_di + minus_di
+        dx_values = np.where(di_sum == 0, 0.0, 100 * np.abs(plus_di - minus_di) / di_sum)
+        dx_values = np.where(tr_smoothed == 0, 0.0, dx_values)
+    adx_value = sequential_sum(dx_values[:, :period]) / period
+    for index in range(period, dx_values.shape[1]):
+        adx_value = (adx_value * (period - 1) + dx_values[:, index]) / period
+    return adx_value
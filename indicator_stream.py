@@ -0,0 +1,185 @@
+from collections import deque
+from typing import List, Optional
+
+# Потоковые версии ema/rsi/atr/adx из bybit_signal_bot: состояние обновляется за O(1)
+# на закрытый бар (update), формирующийся бар считается без фиксации (peek).
+# Для одной и той же последовательности баров значения совпадают со скалярными
+# функциями бит в бит: тот же порядок операций и тот же sum() на разгоне.
+
+
+class EmaState:
+    def __init__(self, period: int):
+        self.k = 2 / (period + 1)
+        self.value: Optional[float] = None
+
+    def _next(self, price: float) -> float:
+        if self.value is None:
+            return price
+        return self.value + self.k * (price - self.value)
+
+    def update(self, price: float) -> float:
+        self.value = self._next(price)
+        return self.value
+
+    def peek(self, price: float) -> float:
+        return self._next(price)
+
+
+class WilderAverage:
+    # sum(первых period)/period, затем (avg*(period-1)+x)/period — как в rsi()/atr()/adx()
+    def __init__(self, period: int):
+        self.period = period
+        self.warmup: List[float] = []
+        self.value: Optional[float] = None
+
+    def _next(self, x: float) -> Optional[float]:
+        if self.value is not None:
+            return (self.value * (self.period - 1) + x) / self.period
+        if len(self.warmup) + 1 == self.period:
+            return sum(self.warmup + [x]) / self.period
+        return None
+
+    def update(self, x: float) -> Optional[float]:
+        value = self._next(x)
+        if self.value is None and value is None:
+            self.warmup.append(x)
+        else:
+            self.warmup = []
+        self.value = value
+        return value
+
+    def peek(self, x: float) -> Optional[float]:
+        return self._next(x)
+
+
+class WilderSum:
+    # сглаженная сумма из adx(): sum(первых period), затем s - s/period + x
+    def __init__(self, period: int):
+        self.period = period
+        self.warmup: List[float] = []
+        self.value: Optional[float] = None
+
+    def _next(self, x: float) -> Optional[float]:
+        if self.value is not None:
+            return self.value - (self.value / self.period) + x
+        return None
+
+    def update(self, x: float) -> Optional[float]:
+        if self.value is None:
+            self.warmup.append(x)
+            if len(self.warmup) == self.period:
+                self.value = sum(self.warmup)
+                self.warmup = []
+            # на разгоне adx() ещё не выдаёт значений dx
+            return None
+        self.value = self._next(x)
+        return self.value
+
+    def peek(self, x: float) -> Optional[float]:
+        return self._next(x)
+
+
+def _dx(tr_smooth: float, plus_smooth: float, minus_smooth: float) -> float:
+    if tr_smooth == 0:
+        return 0.0
+    plus_di = 100 * (plus_smooth / tr_smooth)
+    minus_di = 100 * (minus_smooth / tr_smooth)
+    di_sum = plus_di + minus_di
+    return 0.0 if di_sum == 0 else 100 * abs(plus_di - minus_di) / di_sum
+
+
+class IndicatorStream:
+    # EMA50/EMA200, RSI14, ATR14 и ADX14 по одному ряду баров; хвосты EMA50/RSI
+    # нужны для наклонов (_safe_slope смотрит на 5 последних значений)
+    TAIL = 8
+
+    def __init__(self, period: int = 14, ema_fast: int = 50, ema_slow: int = 200):
+        self.period = period
+        self.last_ts: Optional[int] = None
+        self.bars = 0
+        self.last_bar: Optional[tuple] = None
+        self.ema_fast = EmaState(ema_fast)
+        self.ema_slow = EmaState(ema_slow)
+        self.rsi_gain = WilderAverage(period)
+        self.rsi_loss = WilderAverage(period)
+        self.atr = WilderAverage(period)
+        self.tr_sum = WilderSum(period)
+        self.plus_sum = WilderSum(period)
+        self.minus_sum = WilderSum(period)
+        self.adx = WilderAverage(period)
+        self.ema_fast_tail: deque = deque(maxlen=self.TAIL)
+        self.ema_slow_tail: deque = deque(maxlen=self.TAIL)
+        self.rsi_tail: deque = deque(maxlen=self.TAIL)
+
+    def _rsi_value(self, avg_gain: float, avg_loss: float) -> float:
+        if avg_loss == 0:
+            return 100.0
+        rs = avg_gain / avg_loss
+        return 100 - (100 / (1 + rs))
+
+    def _step(self, high: float, low: float, close: float, commit: bool) -> dict:
+        op = "update" if commit else "peek"
+        values = {
+            "ema_fast": getattr(self.ema_fast, op)(close),
+            "ema_slow": getattr(self.ema_slow, op)(close),
+            "rsi": 50.0,
+            "atr": self.atr.value,
+            "adx": self.adx.value,
+        }
+        if self.last_bar is None:
+            return values
+        prev_high, prev_low, prev_close = self.last_bar
+        diff = close - prev_close
+        avg_gain = getattr(self.rsi_gain, op)(max(diff, 0))
+        avg_loss = getattr(self.rsi_loss, op)(max(-diff, 0))
+        # rsi() отдаёт 50.0 на первых period+1 барах
+        if self.bars > self.period:
+            values["rsi"] = self._rsi_value(avg_gain, avg_loss)
+        tr = max(high - low, abs(high - prev_close), abs(low - prev_close))
+        values["atr"] = getattr(self.atr, op)(tr)
+        up_move = high - prev_high
+        down_move = prev_low - low
+        plus_dm = up_move if up_move > down_move and up_move > 0 else 0.0
+        minus_dm = down_move if down_move > up_move and down_move > 0 else 0.0
+        # первая свёртка после разгона сглаженных сумм уже даёт dx (как в adx())
+        warming = self.tr_sum.value is None
+        tr_smooth = getattr(self.tr_sum, op)(tr)
+        plus_smooth = getattr(self.plus_sum, op)(plus_dm)
+        minus_smooth = getattr(self.minus_sum, op)(minus_dm)
+        if not warming:
+            values["adx"] = getattr(self.adx, op)(_dx(tr_smooth, plus_smooth, minus_smooth))
+        return values
+
+    def update(self, timestamp: int, high: float, low: float, close: float) -> None:
+        values = self._step(high, low, close, True)
+        self.last_bar = (high, low, close)
+        self.last_ts = timestamp
+        self.bars += 1
+        self.ema_fast_tail.append(values["ema_fast"])
+        self.ema_slow_tail.append(values["ema_slow"])
+        self.rsi_tail.append(values["rsi"])
+
+    def snapshot(self, forming: Optional[tuple] = None) -> dict:
+        # значения на последнем баре; forming=(high, low, close) — незакрытый бар
+        ema_fast_tail = list(self.ema_fast_tail)
+        ema_slow_tail = list(self.ema_slow_tail)
+        rsi_tail = list(self.rsi_tail)
+        bars = self.bars
+        atr_value = self.atr.value
+        adx_value = self.adx.value
+        if forming is not None:
+            values = self._step(*forming, commit=False)
+            ema_fast_tail.append(values["ema_fast"])
+            ema_slow_tail.append(values["ema_slow"])
+            rsi_tail.append(values["rsi"])
+            atr_value = values["atr"]
+            adx_value = values["adx"]
+            bars += 1
+        return {
+            "bars": bars,
+            "ema_fast_series": ema_fast_tail,
+            "ema_slow_series": ema_slow_tail,
+            "rsi_series": rsi_tail,
+            "atr": atr_value,
+            "adx": adx_value,
+        }
@@ -0,0 +1,260 @@
+import math
+from bisect import bisect_left, insort
+from collections import deque
+from typing import Deque, List, Optional, Tuple
+
+# Скользящие окна с обновлением на добавленный бар: экстремумы — монотонной очередью
+# и сумма/дисперсия — префиксными суммами (амортизированное O(1)), медиана —
+# отсортированным окном (bisect + вставка/удаление со сдвигом, O(window)). Запросы
+# принимают current — значение текущего (незафиксированного) бара, которое
+# подмешивается к последним bars - 1 значениям.
+
+
+class RollingMax:
+    def __init__(self, window: int):
+        self.window = window
+        self.count = 0
+        # (индекс, значение), значения строго убывают от головы к хвосту
+        self._deque: Deque[Tuple[int, float]] = deque()
+
+    def _dominates(self, new: float, old: float) -> bool:
+        return new >= old
+
+    def _pick(self, a: float, b: float) -> float:
+        return max(a, b)
+
+    def append(self, value: float) -> None:
+        while self._deque and self._dominates(value, self._deque[-1][1]):
+            self._deque.pop()
+        self._deque.append((self.count, value))
+        self.count += 1
+        while self._deque[0][0] < self.count - self.window:
+            self._deque.popleft()
+
+    def query(self, bars: Optional[int] = None, current: Optional[float] = None) -> Optional[float]:
+        bars = self.window if bars is None else bars
+        committed = bars - 1 if current is not None else bars
+        result = None
+        if committed > 0:
+            start = self.count - committed
+            for index, value in self._deque:
+                if index >= start:
+                    result = value
+                    break
+        if current is not None:
+            result = current if result is None else self._pick(result, current)
+        return result
+
+
+class RollingMin(RollingMax):
+    def _dominates(self, new: float, old: float) -> bool:
+        return new <= old
+
+    def _pick(self, a: float, b: float) -> float:
+        return min(a, b)
+
+
+class RollingSum:
+    # префиксные суммы (и суммы квадратов) отклонений от опорного значения;
+    # опора переносится на среднее окна раз в window добавлений, чтобы не копить погрешность
+    def __init__(self, window: int):
+        self.window = window
+        self._values: Deque[float] = deque(maxlen=window)
+        self._prefix: Deque[Tuple[float, float]] = deque(maxlen=window + 1)
+        self._reference = 0.0
+        self._since_rebase = 0
+
+    def __len__(self) -> int:
+        return len(self._values)
+
+    def _rebase(self) -> None:
+        self._reference = sum(self._values) / len(self._values)
+        self._prefix = deque([(0.0, 0.0)], maxlen=self.window + 1)
+        total = squares = 0.0
+        for value in self._values:
+            delta = value - self._reference
+            total += delta
+            squares += delta * delta
+            self._prefix.append((total, squares))
+        self._since_rebase = 0
+
+    def append(self, value: float) -> None:
+        self._values.append(value)
+        self._since_rebase += 1
+        if not self._prefix or self._since_rebase >= self.window:
+            self._rebase()
+            return
+        total, squares = self._prefix[-1]
+        delta = value - self._reference
+        self._prefix.append((total + delta, squares + delta * delta))
+
+    def _moments(self, bars: int, current: Optional[float]) -> Optional[Tuple[float, float]]:
+        committed = bars - 1 if current is not None else bars
+        if bars <= 0 or committed > len(self._values):
+            return None
+        total = squares = 0.0
+        if committed > 0:
+            total_end, squares_end = self._prefix[-1]
+            total_start, squares_start = self._prefix[-1 - committed]
+            total = total_end - total_start
+            squares = squares_end - squares_start
+        if current is not None:
+            delta = current - self._reference
+            total += delta
+            squares += delta * delta
+        return total, squares
+
+    def sum(self, bars: int, current: Optional[float] = None) -> Optional[float]:
+        moments = self._moments(bars, current)
+        if moments is None:
+            return None
+        return moments[0] + self._reference * bars
+
+    def mean(self, bars: int, current: Optional[float] = None) -> Optional[float]:
+        moments = self._moments(bars, current)
+        if moments is None:
+            return None
+        return self._reference + moments[0] / bars
+
+    def variance(self, bars: int, current: Optional[float] = None) -> Optional[float]:
+        moments = self._moments(bars, current)
+        if moments is None:
+            return None
+        total, squares = moments
+        return max(0.0, (squares - total * total / bars) / bars)
+
+    def std(self, bars: int, current: Optional[float] = None) -> Optional[float]:
+        variance = self.variance(bars, current)
+        return None if variance is None else math.sqrt(variance)
+
+
+class RollingMedian:
+    # окно в порядке поступления + то же окно отсортированным (bisect), медиана — O(1).
+    # Вставка/удаление — сдвиг списка, O(window), но на окне в 199 баров это один memmove
+    # (~1.3 мкс на бар против ~5 мкс у двух куч с ленивым удалением); кучи к тому же не
+    # дают соседей медианы, нужных для подмешивания current
+    def __init__(self, window: int):
+        self.window = window
+        self._order: Deque[float] = deque()
+        self._sorted: List[float] = []
+
+    def __len__(self) -> int:
+        return len(self._order)
+
+    def append(self, value: float) -> None:
+        if len(self._order) == self.window:
+            expired = self._order.popleft()
+            del self._sorted[bisect_left(self._sorted, expired)]
+        self._order.append(value)
+        insort(self._sorted, value)
+
+    def median(self, current: Optional[float] = None) -> float:
+        # та же выборка элементов, что у _median(sorted(...)) в боте
+        values = self._sorted
+        size = len(values) + (current is not None)
+        if size == 0:
+            return 0.0
+        position = bisect_left(values, current) if current is not None else size
+
+        def kth(k: int) -> float:
+            if k < position:
+                return values[k]
+            if k == position:
+                return current  # type: ignore[return-value]
+            return values[k - 1]
+
+        mid = size // 2
+        if size % 2 == 0:
+            return (kth(mid - 1) + kth(mid)) / 2
+        return kth(mid)
+
+
+class BarWindows:
+    # окна одного ряда свечей для build_features/check_trigger/_has_anomalies; все бары,
+    # кроме последнего, фиксируются, последний (текущий) подмешивается при чтении —
+    # формирующийся и только что закрытый бар обрабатываются одинаково
+    def __init__(
+        self,
+        level_bars: int = 20,
+        swing_bars: int = 20,
+        retest_bars: int = 6,
+        compression_bars: int = 8,
+        average_bars: int = 20,
+        anomaly_bars: int = 200,
+    ):
+        self.level_bars = level_bars
+        self.swing_bars = swing_bars
+        self.retest_bars = retest_bars
+        self.compression_bars = compression_bars
+        self.average_bars = average_bars
+        self.anomaly_bars = anomaly_bars
+        extreme_window = max(level_bars, swing_bars, retest_bars, compression_bars)
+        self.highs = RollingMax(extreme_window)
+        self.lows = RollingMin(extreme_window)
+        self.closes = RollingSum(average_bars - 1)
+        self.volumes = RollingSum(average_bars - 1)
+        self.ranges = RollingMedian(anomaly_bars - 1)
+        self.range_max = RollingMax(anomaly_bars - 1)
+        self.gaps = RollingMax(anomaly_bars - 2)
+        self.bars = 0
+        self.last_ts: Optional[int] = None
+        self.last_bar: Optional[tuple] = None
+        # номер (bars) последнего зафиксированного бара с некорректными ценами
+        self.last_invalid: Optional[int] = None
+
+    @staticmethod
+    def _gap(prev_close: float, close: float) -> float:
+        return math.inf if prev_close <= 0 else abs(close - prev_close) / prev_close
+
+    @staticmethod
+    def _valid(high: float, low: float, close: float) -> bool:
+        return high > 0 and low > 0 and close > 0 and low <= high and low <= close <= high
+
+    def update(self, timestamp: int, high: float, low: float, close: float, volume: float) -> None:
+        if self.last_bar is not None:
+            self.gaps.append(self._gap(self.last_bar[2], close))
+        self.highs.append(high)
+        self.lows.append(low)
+        self.closes.append(close)
+        self.volumes.append(volume)
+        self.ranges.append(high - low)
+        self.range_max.append(high - low)
+        if not self._valid(high, low, close):
+            self.last_invalid = self.bars
+        self.bars += 1
+        self.last_ts = timestamp
+        self.last_bar = (high, low, close, volume)
+
+    def ready(self) -> bool:
+        # все окна заполнены зафиксированными барами
+        return self.bars >= self.anomaly_bars - 1
+
+    def integrity(self, high: float, low: float, close: float) -> dict:
+        gap = self._gap(self.last_bar[2], close) if self.last_bar is not None else 0.0
+        return {
+            "range_median": self.ranges.median(current=high - low),
+            "range_max": self.range_max.query(self.anomaly_bars, current=high - low),
+            "max_gap": self.gaps.query(self.anomaly_bars - 1, current=gap),
+            # сколько зафиксированных баров назад был некорректный бар (1 — предыдущий)
+            "invalid_age": None if self.last_invalid is None else self.bars - self.last_invalid,
+            "current_valid": self._valid(high, low, close),
+        }
+
+    def snapshot(self, high: float, low: float, close: float, volume: float) -> dict:
+        close_std = self.closes.std(self.average_bars, current=close)
+        return {
+            "high_n_prev": self.highs.query(self.level_bars),
+            "low_n_prev": self.lows.query(self.level_bars),
+            "swing_high": self.highs.query(self.swing_bars, current=high),
+            "swing_low": self.lows.query(self.swing_bars, current=low),
+            "retest_high": self.highs.query(self.retest_bars, current=high),
+            "retest_low": self.lows.query(self.retest_bars, current=low),
+            "recent_range": (
+                self.highs.query(self.compression_bars, current=high)
+                - self.lows.query(self.compression_bars, current=low)
+            ),
+            "close_sma20": self.closes.mean(self.average_bars, current=close),
+            "close_std20": close_std,
+            "volume_sma20": self.volumes.mean(self.average_bars, current=volume),
+            **self.integrity(high, low, close),
+        }